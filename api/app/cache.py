@@ -0,0 +1,84 @@
+"""
+An in-process LRU of serialized GET /documents/{id} responses, keyed by document id.
+
+Each entry carries an ETag, a hash of the serialized response, so clients can
+revalidate with If-None-Match and get a 304 without the body. Writes through this
+API invalidate the documents they touch, and a read only caches what it read if
+nothing invalidated the document while it was reading.
+"""
+
+import hashlib
+import time
+from collections import OrderedDict
+from typing import NamedTuple
+
+
+class CachedResponse(NamedTuple):
+    etag: str
+    body: bytes
+    cached_at: float
+
+
+def etag_for(body: bytes) -> str:
+    return f'"{hashlib.blake2b(body, digest_size=16).hexdigest()}"'
+
+
+def etag_matches(if_none_match: str | None, etag: str) -> bool:
+    if if_none_match is None:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    # weak comparison, as If-None-Match calls for
+    return any(
+        candidate.strip().removeprefix("W/") == etag
+        for candidate in if_none_match.split(",")
+    )
+
+
+class ResponseCache:
+    def __init__(self, max_size: int, ttl: float):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._entries: OrderedDict[str, CachedResponse] = OrderedDict()
+        # key -> times it's been invalidated, for the most recently invalidated keys
+        self._generations: OrderedDict[str, int] = OrderedDict()
+        # bumped when a key's generation is dropped, as the key's count starts over
+        self._dropped = 0
+
+    def get(self, key: str) -> CachedResponse | None:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        if time.monotonic() - entry.cached_at > self.ttl:
+            del self._entries[key]
+            return None
+
+        self._entries.move_to_end(key)
+        return entry
+
+    def generation(self, key: str) -> tuple[int, int]:
+        """Taken before reading the body to `put`, to tell if it's been invalidated."""
+        return (self._dropped, self._generations.get(key, 0))
+
+    def put(self, key: str, body: bytes, generation: tuple[int, int]) -> CachedResponse:
+        entry = CachedResponse(etag_for(body), body, time.monotonic())
+        # GOTCHA: a write can commit and invalidate the key while the body is being
+        # read, and caching the old body then would serve it until the TTL is up
+        if generation != self.generation(key):
+            return entry
+
+        self._entries[key] = entry
+        self._entries.move_to_end(key)
+        if len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+
+        return entry
+
+    def invalidate(self, *keys: str) -> None:
+        for key in keys:
+            self._entries.pop(key, None)
+            self._generations[key] = self._generations.get(key, 0) + 1
+            self._generations.move_to_end(key)
+            if len(self._generations) > self.max_size:
+                self._generations.popitem(last=False)
+                self._dropped += 1
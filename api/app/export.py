@@ -0,0 +1,82 @@
+"""
+Streams the whole documents database as NDJSON LabelledDocuments, one per line, in
+the shape PUT /documents/{id} and POST /documents/bulk accept.
+
+It's one query over documents, their links and labels, ordered by document, read
+through a server-side cursor, so memory stays flat however big the corpus is.
+"""
+
+from datetime import datetime
+from typing import AsyncIterator
+
+from pydantic_core import to_json
+from sqlalchemy import Select
+from sqlalchemy.ext.asyncio import AsyncEngine
+from sqlmodel import select
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+from .document_models import Document, DocumentLabelLink, Label
+from .serialization import label_relationship
+from .writes import naive_utc
+
+# rows fetched from the cursor at a time
+EXPORT_BATCH_SIZE = 5_000
+
+
+def export_query(since: datetime | None) -> Select:
+    query = (
+        select(
+            Document.id,
+            Document.title,
+            DocumentLabelLink.label_id,
+            DocumentLabelLink.relationship,
+            DocumentLabelLink.timestamp,
+            Label.title,
+            Label.type,
+        )
+        .select_from(Document)
+        .outerjoin(DocumentLabelLink, DocumentLabelLink.document_id == Document.id)
+        .outerjoin(Label, Label.id == DocumentLabelLink.label_id)
+        .order_by(Document.id, DocumentLabelLink.label_id)
+    )
+    if since is not None:
+        # GOTCHA: removing a link doesn't leave a timestamp behind, so documents
+        # that only lost labels since then aren't included
+        query = query.where(
+            Document.id.in_(
+                select(DocumentLabelLink.document_id).where(
+                    DocumentLabelLink.timestamp > naive_utc(since)
+                )
+            )
+        )
+
+    return query
+
+
+async def stream_labelled_documents(
+    engine: AsyncEngine, since: datetime | None
+) -> AsyncIterator[bytes]:
+    # the session belongs to the stream rather than the request, as the response
+    # is still being sent after the endpoint returns
+    async with AsyncSession(engine) as session:
+        result = await session.stream(
+            export_query(since).execution_options(yield_per=EXPORT_BATCH_SIZE)
+        )
+
+        document = None
+        async for row in result:
+            id, title, label_id, relationship, timestamp, label_title, type = row
+            if document is None or document["id"] != id:
+                if document is not None:
+                    yield to_json(document) + b"\n"
+                document = {"id": id, "title": title, "labels": [], "collections": []}
+
+            if label_id is not None:
+                document["labels"].append(
+                    label_relationship(
+                        label_id, label_title, type, relationship, timestamp
+                    )
+                )
+
+        if document is not None:
+            yield to_json(document) + b"\n"
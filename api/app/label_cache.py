@@ -0,0 +1,49 @@
+"""
+The labels we know are in the database, as id -> (title, type), so writes only
+upsert labels that are new or changed. The vocabulary is small and rarely changes,
+so after warming at startup nearly every label is a hit.
+
+Labels are only added once the transaction that wrote them has committed, so a hit
+always means the row exists.
+"""
+
+from collections import OrderedDict
+from typing import Iterable
+
+from sqlmodel import select
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+from .document_models import Label
+from .models import Label as LabelModel
+
+
+class LabelCache:
+    def __init__(self, max_size: int):
+        self.max_size = max_size
+        self._labels: OrderedDict[str, tuple[str, str]] = OrderedDict()
+
+    async def warm(self, session: AsyncSession) -> None:
+        self._labels.clear()
+        result = await session.exec(
+            select(Label.id, Label.title, Label.type).limit(self.max_size)
+        )
+        for id, title, type in result:
+            self._labels[id] = (title, type)
+
+    def unknown(self, labels: Iterable[LabelModel]) -> list[LabelModel]:
+        """The labels that aren't in the cache as they are, so need upserting."""
+        unknown = []
+        for label in labels:
+            if self._labels.get(label.id) == (label.title, label.type):
+                self._labels.move_to_end(label.id)
+            else:
+                unknown.append(label)
+
+        return unknown
+
+    def add(self, labels: Iterable[LabelModel]) -> None:
+        for label in labels:
+            self._labels[label.id] = (label.title, label.type)
+            self._labels.move_to_end(label.id)
+        while len(self._labels) > self.max_size:
+            self._labels.popitem(last=False)
@@ -0,0 +1,170 @@
+"""
+Request, SQL and serialization timings, exposed in the Prometheus text format on
+/metrics and per request in a Server-Timing header, so you can see where the time
+goes under load.
+
+Timings within a request are collected in a contextvar, which the SQLAlchemy event
+hooks and `timed` add to wherever they run.
+"""
+
+import time
+from bisect import bisect_left
+from collections import defaultdict
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Iterator
+
+from fastapi import FastAPI, Request
+from fastapi.responses import PlainTextResponse
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+# seconds
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5)
+
+
+class Histogram:
+    def __init__(self, name: str, help: str, buckets: tuple[float, ...]):
+        self.name = name
+        self.help = help
+        self.buckets = buckets
+        # label values -> (count per bucket, sum, count)
+        self._series: dict[tuple[tuple[str, str], ...], list] = {}
+
+    def observe(self, value: float, **labels: str) -> None:
+        key = tuple(sorted(labels.items()))
+        series = self._series.get(key)
+        if series is None:
+            series = self._series[key] = [[0] * len(self.buckets), 0.0, 0]
+        index = bisect_left(self.buckets, value)
+        if index < len(self.buckets):
+            series[0][index] += 1
+        series[1] += value
+        series[2] += 1
+
+    def render(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        for key, (buckets, total, count) in self._series.items():
+            cumulative = 0
+            for bound, bucket in zip(self.buckets, buckets):
+                cumulative += bucket
+                lines.append(
+                    f"{self.name}_bucket{format_labels(key, le=str(bound))} {cumulative}"
+                )
+            lines.append(f"{self.name}_bucket{format_labels(key, le='+Inf')} {count}")
+            lines.append(f"{self.name}_sum{format_labels(key)} {total}")
+            lines.append(f"{self.name}_count{format_labels(key)} {count}")
+
+        return lines
+
+
+def format_labels(key: tuple[tuple[str, str], ...], **extra: str) -> str:
+    pairs = [*key, *extra.items()]
+    if not pairs:
+        return ""
+    escaped = (
+        (name, value.replace("\\", "\\\\").replace('"', '\\"')) for name, value in pairs
+    )
+    return "{" + ",".join(f'{name}="{value}"' for name, value in escaped) + "}"
+
+
+request_duration = Histogram(
+    "http_request_duration_seconds", "Time to the response headers", LATENCY_BUCKETS
+)
+sql_duration = Histogram(
+    "sql_statement_duration_seconds", "Time per SQL statement", LATENCY_BUCKETS
+)
+sql_statements = Histogram(
+    "sql_statements_per_request",
+    "SQL statements run by a request",
+    (0, 1, 2, 3, 5, 10, 25, 50, 100),
+)
+
+# phase -> [count, seconds] for the current request
+request_timings: ContextVar[dict[str, list] | None] = ContextVar(
+    "request_timings", default=None
+)
+
+
+def record(phase: str, seconds: float) -> None:
+    timings = request_timings.get()
+    if timings is not None:
+        timings[phase][0] += 1
+        timings[phase][1] += seconds
+
+
+@contextmanager
+def timed(phase: str) -> Iterator[None]:
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        record(phase, time.perf_counter() - started)
+
+
+def instrument_engine(engine: Engine) -> None:
+    """Times every statement run on `engine` (the sync_engine of an async one)."""
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def before_cursor_execute(conn, cursor, statement, parameters, context, many):
+        # GOTCHA: on the statement's own context rather than the connection, so a
+        # statement that raises doesn't leave its start behind for the next one
+        context._statement_started = time.perf_counter()
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def after_cursor_execute(conn, cursor, statement, parameters, context, many):
+        elapsed = time.perf_counter() - context._statement_started
+        sql_duration.observe(elapsed, statement=statement.split(None, 1)[0].upper())
+        record("db", elapsed)
+
+
+def server_timing(timings: dict[str, list], total: float) -> str:
+    metrics = [
+        f'{phase};dur={seconds * 1000:.1f};desc="{count}"'
+        for phase, (count, seconds) in timings.items()
+    ]
+    # whatever isn't accounted for: routing, validation, our own code
+    other = total - sum(seconds for _, seconds in timings.values())
+    metrics.append(f"app;dur={other * 1000:.1f}")
+    metrics.append(f"total;dur={total * 1000:.1f}")
+
+    return ", ".join(metrics)
+
+
+def instrument_app(app: FastAPI) -> None:
+    """Adds the timing middleware and the /metrics endpoint."""
+
+    @app.middleware("http")
+    async def timing_middleware(request: Request, call_next):
+        timings: dict[str, list] = defaultdict(lambda: [0, 0.0])
+        token = request_timings.set(timings)
+        started = time.perf_counter()
+        try:
+            response = await call_next(request)
+        finally:
+            request_timings.reset(token)
+        total = time.perf_counter() - started
+
+        # the route template rather than the path, to keep the label set small
+        route = request.scope.get("route")
+        request_duration.observe(
+            total,
+            method=request.method,
+            route=getattr(route, "path", "unmatched"),
+            status=str(response.status_code),
+        )
+        sql_statements.observe(timings["db"][0] if "db" in timings else 0)
+        response.headers["Server-Timing"] = server_timing(timings, total)
+        # lets browsers show it for cross-origin requests too
+        response.headers["Timing-Allow-Origin"] = "*"
+
+        return response
+
+    @app.get("/metrics", response_class=PlainTextResponse, include_in_schema=False)
+    def metrics():
+        lines = []
+        for histogram in [request_duration, sql_duration, sql_statements]:
+            lines.extend(histogram.render())
+        return PlainTextResponse(
+            "\n".join(lines) + "\n", media_type="text/plain; version=0.0.4"
+        )
@@ -0,0 +1,387 @@
+"""
+Writes of LabelledDocuments that only touch the rows that changed.
+
+A single document is diffed against what's stored, in one read. A bulk batch is a
+handful of statements whatever its size: one upsert each for the labels, documents
+and links, and one delete for the links documents no longer have. Their rows are
+bound as one array per column and unnested, as Postgres allows at most 32767
+parameters in a statement. The IS DISTINCT FROM guards mean unchanged rows aren't
+rewritten, and RETURNING tells us which documents actually changed.
+
+A label's title and type are part of every document linked to it, so the writes
+also return the ids of the documents linked to labels whose title or type changed,
+for the caller to invalidate alongside the documents it wrote.
+"""
+
+import codecs
+import json
+from datetime import datetime, timezone
+from typing import Any, AsyncIterator, Iterable, Literal
+
+from pydantic import BaseModel, ValidationError
+from sqlalchemy import (
+    DateTime,
+    Text,
+    any_,
+    bindparam,
+    delete,
+    exists,
+    func,
+    literal_column,
+    select,
+    tuple_,
+    update,
+)
+from sqlalchemy.dialects.postgresql import ARRAY, insert
+from sqlalchemy.exc import DBAPIError
+from sqlalchemy.sql.type_api import TypeEngine
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+from .document_models import Document, DocumentLabelLink, Label
+from .label_cache import LabelCache
+from .models import Label as LabelModel
+from .models import LabelledDocument, LabelRelationship
+
+ItemStatus = Literal["created", "updated", "unchanged", "invalid", "failed"]
+
+
+class BulkItemStatus(BaseModel):
+    # position in the request body
+    index: int
+    id: str | None
+    status: ItemStatus
+    error: str | None = None
+
+
+async def iter_json_values(chunks: AsyncIterator[bytes]) -> AsyncIterator[object]:
+    """
+    Parses a streamed NDJSON body or JSON array one value at a time, so the whole
+    body is never held in memory.
+
+    Values can be separated by any mix of whitespace and commas, optionally inside
+    one top-level [...], which covers both formats.
+    """
+    decoder = json.JSONDecoder()
+    text_decoder = codecs.getincrementaldecoder("utf-8")()
+    buffer = ""
+    done = False
+    while not done:
+        try:
+            buffer += text_decoder.decode(await anext(chunks))
+        except StopAsyncIteration:
+            buffer += text_decoder.decode(b"", final=True)
+            done = True
+
+        position = 0
+        while True:
+            while position < len(buffer) and buffer[position] in " \t\r\n,[]":
+                position += 1
+            if position == len(buffer):
+                break
+            try:
+                value, position = decoder.raw_decode(buffer, position)
+            except json.JSONDecodeError:
+                if done:
+                    raise
+                # an incomplete value, wait for the next chunk
+                break
+            yield value
+        buffer = buffer[position:]
+
+
+def naive_utc(timestamp: datetime) -> datetime:
+    # GOTCHA: the timestamp columns are without time zone, and asyncpg refuses to
+    # bind an aware datetime to one rather than guess
+    if timestamp.tzinfo is None:
+        return timestamp
+    return timestamp.astimezone(timezone.utc).replace(tzinfo=None)
+
+
+def array(values: list[Any], type_: TypeEngine) -> Any:
+    """`values` bound as a single array parameter, however many there are."""
+    return bindparam(None, values, type_=ARRAY(type_))
+
+
+def unnest(**columns: tuple[list[Any], TypeEngine]) -> Any:
+    """Rows of `columns`, each one bound as a single array of its values."""
+    return (
+        func.unnest(*[array(values, type_) for values, type_ in columns.values()])
+        .table_valued(*columns)
+        .render_derived()
+    )
+
+
+async def upsert_labels(
+    session: AsyncSession, labels: Iterable[LabelModel], label_cache: LabelCache
+) -> tuple[list[LabelModel], set[str]]:
+    """
+    Upserts the labels the cache doesn't know, all in one statement. Returns them,
+    to be added to the cache once the transaction commits, and the ids of the
+    documents linked to the labels that were inserted or changed.
+    """
+    unknown = label_cache.unknown(labels)
+    if not unknown:
+        return [], set()
+
+    rows = unnest(
+        id=([label.id for label in unknown], Text()),
+        title=([label.title for label in unknown], Text()),
+        type=([label.type for label in unknown], Text()),
+    )
+    statement = insert(Label).from_select(
+        ["id", "title", "type"], select(rows.c.id, rows.c.title, rows.c.type)
+    )
+    result = await session.exec(
+        statement.on_conflict_do_update(
+            index_elements=[Label.id],
+            set_={"title": statement.excluded.title, "type": statement.excluded.type},
+            where=tuple_(Label.title, Label.type).is_distinct_from(
+                tuple_(statement.excluded.title, statement.excluded.type)
+            ),
+        ).returning(Label.id)
+    )
+    written = list(result.scalars())
+    if not written:
+        return unknown, set()
+
+    result = await session.exec(
+        select(DocumentLabelLink.document_id)
+        .where(DocumentLabelLink.label_id == any_(array(written, Text())))
+        .distinct()
+    )
+    return unknown, set(result.scalars())
+
+
+async def upsert_links(
+    session: AsyncSession, links: dict[tuple[str, str], LabelRelationship]
+) -> set[str]:
+    """Returns the ids of the documents whose links were inserted or updated."""
+    if not links:
+        return set()
+
+    rows = unnest(
+        document_id=([document_id for document_id, _ in links], Text()),
+        label_id=([label_id for _, label_id in links], Text()),
+        relationship=(
+            [label_relationship.relationship for label_relationship in links.values()],
+            Text(),
+        ),
+        timestamp=(
+            [
+                naive_utc(label_relationship.timestamp)
+                for label_relationship in links.values()
+            ],
+            DateTime(),
+        ),
+    )
+    statement = insert(DocumentLabelLink).from_select(
+        ["document_id", "label_id", "relationship", "timestamp"],
+        select(
+            rows.c.document_id, rows.c.label_id, rows.c.relationship, rows.c.timestamp
+        ),
+    )
+    # unchanged links keep the timestamp from when they were first made
+    result = await session.exec(
+        statement.on_conflict_do_update(
+            index_elements=[
+                DocumentLabelLink.document_id,
+                DocumentLabelLink.label_id,
+            ],
+            set_={
+                "relationship": statement.excluded.relationship,
+                "timestamp": statement.excluded.timestamp,
+            },
+            where=DocumentLabelLink.relationship.is_distinct_from(
+                statement.excluded.relationship
+            ),
+        ).returning(DocumentLabelLink.document_id)
+    )
+    return set(result.scalars())
+
+
+async def put_labelled_document(
+    session: AsyncSession, document: LabelledDocument, label_cache: LabelCache
+) -> tuple[list[LabelModel], set[str]]:
+    """
+    Writes only the differences between `document` and what's stored, so that an
+    unchanged document is one read and no writes. Returns the labels it upserted,
+    for the label cache once the caller commits, and the ids of the other documents
+    whose labels it changed.
+    """
+    result = await session.exec(
+        select(
+            Document.title,
+            DocumentLabelLink.label_id,
+            DocumentLabelLink.relationship,
+            Label.title,
+            Label.type,
+        )
+        .select_from(Document)
+        .outerjoin(DocumentLabelLink, DocumentLabelLink.document_id == Document.id)
+        .outerjoin(Label, Label.id == DocumentLabelLink.label_id)
+        .where(Document.id == document.id)
+    )
+    stored = result.all()
+    stored_links = {
+        label_id: (relationship, LabelModel(id=label_id, title=title, type=type))
+        for _, label_id, relationship, title, type in stored
+        if label_id is not None
+    }
+    incoming = {
+        label_relationship.label.id: label_relationship
+        for label_relationship in document.labels
+    }
+
+    if not stored:
+        await session.exec(
+            insert(Document).values(id=document.id, title=document.title)
+        )
+    elif stored[0][0] != document.title:
+        await session.exec(
+            update(Document)
+            .where(Document.id == document.id)
+            .values(title=document.title)
+        )
+
+    # labels this document already links to are known to exist and be up to date
+    labels = [
+        label_relationship.label
+        for label_id, label_relationship in incoming.items()
+        if label_id not in stored_links
+        or stored_links[label_id][1] != label_relationship.label
+    ]
+    written_labels, relabelled = await upsert_labels(session, labels, label_cache)
+
+    removed = stored_links.keys() - incoming.keys()
+    if removed:
+        await session.exec(
+            delete(DocumentLabelLink)
+            .where(DocumentLabelLink.document_id == document.id)
+            .where(DocumentLabelLink.label_id.in_(removed))
+        )
+
+    links = {
+        (document.id, label_id): label_relationship
+        for label_id, label_relationship in incoming.items()
+        if label_id not in stored_links
+        or stored_links[label_id][0] != label_relationship.relationship
+    }
+    await upsert_links(session, links)
+
+    return written_labels, relabelled - {document.id}
+
+
+def parse_items(
+    values: list[tuple[int, object]],
+) -> tuple[list[tuple[int, LabelledDocument]], list[BulkItemStatus]]:
+    documents = []
+    invalid = []
+    for index, value in values:
+        try:
+            documents.append((index, LabelledDocument.model_validate(value)))
+        except ValidationError as error:
+            id = value.get("id") if isinstance(value, dict) else None
+            invalid.append(
+                BulkItemStatus(
+                    index=index,
+                    id=id if isinstance(id, str) else None,
+                    status="invalid",
+                    error=str(error),
+                )
+            )
+
+    return documents, invalid
+
+
+async def upsert_documents(
+    session: AsyncSession,
+    documents: list[tuple[int, LabelledDocument]],
+    label_cache: LabelCache,
+) -> tuple[list[BulkItemStatus], set[str]]:
+    """
+    Upserts a batch of documents in one transaction. Returns each one's status, and
+    the ids of the documents outside the batch whose labels it changed.
+    """
+    # a row can only be upserted once per statement, so the last copy of a document wins
+    latest = {document.id: document for _, document in documents}
+
+    labels = {
+        label_relationship.label.id: label_relationship.label
+        for document in latest.values()
+        for label_relationship in document.labels
+    }
+    links = {
+        (document.id, label_relationship.label.id): label_relationship
+        for document in latest.values()
+        for label_relationship in document.labels
+    }
+
+    try:
+        written_labels, relabelled = await upsert_labels(
+            session, labels.values(), label_cache
+        )
+
+        rows = unnest(
+            id=(list(latest), Text()),
+            title=([document.title for document in latest.values()], Text()),
+        )
+        statement = insert(Document).from_select(
+            ["id", "title"], select(rows.c.id, rows.c.title)
+        )
+        # xmax is 0 for a freshly inserted row
+        result = await session.exec(
+            statement.on_conflict_do_update(
+                index_elements=[Document.id],
+                set_={"title": statement.excluded.title},
+                where=Document.title.is_distinct_from(statement.excluded.title),
+            ).returning(Document.id, literal_column("xmax = 0"))
+        )
+        written = result.all()
+        created = {id for id, inserted in written if inserted}
+        changed = {id for id, _ in written}
+
+        kept = unnest(
+            document_id=([document_id for document_id, _ in links], Text()),
+            label_id=([label_id for _, label_id in links], Text()),
+        )
+        result = await session.exec(
+            delete(DocumentLabelLink)
+            .where(DocumentLabelLink.document_id == any_(array(list(latest), Text())))
+            .where(
+                ~exists().where(
+                    kept.c.document_id == DocumentLabelLink.document_id,
+                    kept.c.label_id == DocumentLabelLink.label_id,
+                )
+            )
+            .returning(DocumentLabelLink.document_id)
+        )
+        changed.update(result.scalars())
+
+        changed.update(await upsert_links(session, links))
+
+        await session.commit()
+        label_cache.add(written_labels)
+    except DBAPIError as error:
+        await session.rollback()
+        return [
+            BulkItemStatus(
+                index=index, id=document.id, status="failed", error=str(error.orig)
+            )
+            for index, document in documents
+        ], set()
+
+    # documents in the batch that only changed through a label are updated too
+    changed.update(relabelled & latest.keys())
+    statuses = [
+        BulkItemStatus(
+            index=index,
+            id=document.id,
+            status="created"
+            if document.id in created
+            else "updated"
+            if document.id in changed
+            else "unchanged",
+        )
+        for index, document in documents
+    ]
+    return statuses, relabelled - latest.keys()
@@ -0,0 +1,95 @@
+"""
+Load tests the read endpoints of one or more running documents APIs, to compare
+throughput and latency between them (e.g. two revisions on different ports).
+
+    python load_test.py --target before=http://localhost:8000 --target after=http://localhost:8010
+
+Each client pages through GET /documents with the cursor and fetches every document
+on the page with GET /documents/{id}, over and over, for --duration seconds.
+"""
+
+import argparse
+import asyncio
+import statistics
+import time
+from dataclasses import dataclass, field
+
+import httpx
+
+
+@dataclass
+class Results:
+    # seconds per request
+    latencies: list[float] = field(default_factory=list)
+    errors: int = 0
+
+    def report(self, name: str, elapsed: float) -> str:
+        quantiles = statistics.quantiles(self.latencies, n=100)
+        return (
+            f"{name:<12} {len(self.latencies) / elapsed:>8.0f} req/s"
+            f"  p50 {quantiles[49] * 1000:>7.1f}ms  p99 {quantiles[98] * 1000:>7.1f}ms"
+            f"  {self.errors} errors"
+        )
+
+
+async def request(client: httpx.AsyncClient, url: str, results: Results, **params):
+    started = time.perf_counter()
+    try:
+        response = await client.get(url, params=params)
+        response.raise_for_status()
+    except httpx.HTTPError:
+        results.errors += 1
+        return None
+    results.latencies.append(time.perf_counter() - started)
+    return response.json()
+
+
+async def client_loop(
+    client: httpx.AsyncClient, results: Results, page_size: int, deadline: float
+) -> None:
+    cursor = None
+    while time.perf_counter() < deadline:
+        params = {"page_size": page_size} | ({"after": cursor} if cursor else {})
+        page = await request(client, "/documents", results, **params)
+        if page is None:
+            continue
+        for document in page["data"]:
+            await request(client, f"/documents/{document['id']}", results)
+        cursor = page.get("next_cursor")
+
+
+async def run(url: str, concurrency: int, page_size: int, duration: float) -> Results:
+    results = Results()
+    limits = httpx.Limits(max_connections=concurrency)
+    async with httpx.AsyncClient(base_url=url, limits=limits, timeout=30.0) as client:
+        # one request first, so connection setup and warm-up aren't measured
+        await request(client, "/documents", Results())
+        deadline = time.perf_counter() + duration
+        await asyncio.gather(
+            *[
+                client_loop(client, results, page_size, deadline)
+                for _ in range(concurrency)
+            ]
+        )
+
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "--target",
+        action="append",
+        required=True,
+        help="name=url of an API to test, can be repeated",
+    )
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--page-size", type=int, default=10)
+    parser.add_argument("--duration", type=float, default=30.0)
+    args = parser.parse_args()
+
+    print(f"{args.concurrency} clients, {args.duration:.0f}s per target")
+    for target in args.target:
+        name, url = target.split("=", 1)
+        results = asyncio.run(run(url, args.concurrency, args.page_size, args.duration))
+        print(results.report(name, args.duration))
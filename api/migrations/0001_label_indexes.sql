@@ -0,0 +1,19 @@
+-- Indexes for browsing labels and finding the documents on a label. Safe to re-run.
+-- CONCURRENTLY doesn't block writes while building, but can't run in a transaction,
+-- so run this with plain `psql -f` (which autocommits each statement).
+
+CREATE EXTENSION IF NOT EXISTS pg_trgm;
+
+-- the primary key leads with document_id, so lookups by label need their own
+CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_documentlabellink_label_id
+    ON documentlabellink (label_id, document_id);
+
+-- browsing labels by type, in id order
+CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_label_type_id
+    ON label (type, id);
+
+-- prefix and substring search on titles
+CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_label_title_trgm
+    ON label USING gin (title gin_trgm_ops);
+
+ANALYZE label, documentlabellink;
@@ -0,0 +1,63 @@
+from app.cache import ResponseCache, etag_for, etag_matches
+
+
+def test_put_is_cached_with_its_etag():
+    cache = ResponseCache(max_size=10, ttl=60)
+
+    cache.put("1", b"body", cache.generation("1"))
+
+    assert cache.get("1").body == b"body"
+    assert cache.get("1").etag == etag_for(b"body")
+
+
+def test_put_after_an_invalidate_is_dropped():
+    cache = ResponseCache(max_size=10, ttl=60)
+    # a read misses and queries the database, and a write invalidates meanwhile
+    generation = cache.generation("1")
+    cache.invalidate("1")
+
+    entry = cache.put("1", b"stale", generation)
+
+    assert entry.body == b"stale"
+    assert cache.get("1") is None
+    cache.put("1", b"fresh", cache.generation("1"))
+    assert cache.get("1").body == b"fresh"
+
+
+def test_invalidating_other_keys_doesnt_drop_a_put():
+    cache = ResponseCache(max_size=10, ttl=60)
+    generation = cache.generation("1")
+    cache.invalidate("2")
+
+    cache.put("1", b"body", generation)
+
+    assert cache.get("1").body == b"body"
+
+
+def test_dropping_an_old_generation_drops_reads_in_flight():
+    cache = ResponseCache(max_size=2, ttl=60)
+    cache.invalidate("1")
+    generation = cache.generation("1")
+    # enough other invalidations that "1"'s count is forgotten
+    cache.invalidate("2", "3")
+
+    cache.put("1", b"body", generation)
+
+    assert cache.get("1") is None
+
+
+def test_expired_entries_are_misses():
+    cache = ResponseCache(max_size=10, ttl=-1)
+    cache.put("1", b"body", cache.generation("1"))
+
+    assert cache.get("1") is None
+
+
+def test_etag_matches_weakly_and_in_lists():
+    etag = etag_for(b"body")
+
+    assert etag_matches(etag, etag)
+    assert etag_matches(f'"other", W/{etag}', etag)
+    assert etag_matches("*", etag)
+    assert not etag_matches('"other"', etag)
+    assert not etag_matches(None, etag)
@@ -0,0 +1,35 @@
+from app.label_cache import LabelCache
+from app.models import Label
+
+LAW = Label(id="Genre/Law", title="Law", type="Genre")
+POLICY = Label(id="Genre/Policy", title="Policy", type="Genre")
+
+
+def test_unknown_labels_until_added():
+    cache = LabelCache(max_size=10)
+
+    assert cache.unknown([LAW, POLICY]) == [LAW, POLICY]
+    cache.add([LAW])
+    assert cache.unknown([LAW, POLICY]) == [POLICY]
+
+
+def test_a_changed_label_is_unknown():
+    cache = LabelCache(max_size=10)
+    cache.add([LAW])
+
+    retitled = Label(id=LAW.id, title="Laws", type=LAW.type)
+    retyped = Label(id=LAW.id, title=LAW.title, type="Topic")
+
+    assert cache.unknown([retitled, retyped]) == [retitled, retyped]
+
+
+def test_add_evicts_the_least_recently_used():
+    cache = LabelCache(max_size=2)
+    housing = Label(id="Topic/Housing", title="Housing", type="Topic")
+    cache.add([LAW, POLICY])
+    # a hit makes LAW the most recently used
+    cache.unknown([LAW])
+
+    cache.add([housing])
+
+    assert cache.unknown([LAW, POLICY, housing]) == [POLICY]
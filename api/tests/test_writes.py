@@ -0,0 +1,87 @@
+import asyncio
+import json
+
+import pytest
+
+from app.writes import iter_json_values, parse_items
+
+DOCUMENT = {
+    "id": "1",
+    "title": "Law on Energy Saving",
+    "labels": [
+        {
+            "label": {"id": "Genre/Law", "title": "Law", "type": "Genre"},
+            "relationship": "is",
+            "timestamp": "2025-09-18T21:40:25",
+        }
+    ],
+    "collections": [],
+}
+
+
+def values(*chunks: bytes) -> list[object]:
+    async def stream():
+        for chunk in chunks:
+            yield chunk
+
+    async def collect():
+        return [value async for value in iter_json_values(stream())]
+
+    return asyncio.run(collect())
+
+
+def chunked(body: bytes, size: int) -> list[bytes]:
+    return [body[i : i + size] for i in range(0, len(body), size)]
+
+
+def test_ndjson_and_array_bodies_read_the_same():
+    documents = [DOCUMENT, {**DOCUMENT, "id": "2"}]
+    ndjson = "\n".join(json.dumps(document) for document in documents).encode()
+
+    assert values(ndjson) == documents
+    assert values(json.dumps(documents).encode()) == documents
+
+
+def test_blank_lines_are_skipped():
+    body = b'\n\n{"id": "1"}\r\n\n  \n{"id": "2"}\n\n'
+
+    assert values(body) == [{"id": "1"}, {"id": "2"}]
+
+
+@pytest.mark.parametrize("size", [1, 7, 64])
+def test_values_split_across_chunks(size):
+    documents = [DOCUMENT, {**DOCUMENT, "id": "2", "title": "Énergie 🌍"}]
+    body = "\n".join(json.dumps(document, ensure_ascii=False) for document in documents)
+
+    # chunks split values, and multi-byte characters, at arbitrary points
+    assert values(*chunked(body.encode(), size)) == documents
+
+
+def test_malformed_trailing_line_raises_after_the_good_values():
+    body = (json.dumps(DOCUMENT) + "\n" + json.dumps(DOCUMENT)[:-30]).encode()
+    read = []
+
+    async def collect():
+        async def stream():
+            for chunk in chunked(body, 16):
+                yield chunk
+
+        async for value in iter_json_values(stream()):
+            read.append(value)
+
+    with pytest.raises(json.JSONDecodeError):
+        asyncio.run(collect())
+    assert read == [DOCUMENT]
+
+
+def test_parse_items_reports_invalid_values_by_position():
+    documents, invalid = parse_items(
+        [(0, DOCUMENT), (1, {"id": "2", "title": "No labels"}), (2, [1, 2])]
+    )
+
+    assert [(index, document.id) for index, document in documents] == [(0, "1")]
+    assert [(status.index, status.id, status.status) for status in invalid] == [
+        (1, "2", "invalid"),
+        (2, None, "invalid"),
+    ]
+    assert "labels" in invalid[0].error
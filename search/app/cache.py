@@ -0,0 +1,62 @@
+"""
+An in-process LRU of serialized search responses, keyed by the normalised filter
+expression (see filters.py), so the same filters in a different order share an
+entry.
+
+Vespa only changes when we feed it, so the feed empties the cache through
+POST /cache/invalidate, and the TTL covers feeds that don't. A search only caches
+its result if the cache wasn't emptied while it waited on Vespa.
+"""
+
+import time
+from collections import OrderedDict
+from typing import NamedTuple
+
+from .filters import Expression
+
+
+class CachedResult(NamedTuple):
+    body: bytes
+    cached_at: float
+
+
+class ResultCache:
+    def __init__(self, max_size: int, ttl: float):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._entries: OrderedDict[Expression, CachedResult] = OrderedDict()
+        # bumped by every clear()
+        self._generation = 0
+
+    def get(self, key: Expression) -> CachedResult | None:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        if time.monotonic() - entry.cached_at > self.ttl:
+            del self._entries[key]
+            return None
+
+        self._entries.move_to_end(key)
+        return entry
+
+    def generation(self) -> int:
+        """Taken before querying for the body to `put`, to tell if it's been cleared."""
+        return self._generation
+
+    def put(self, key: Expression, body: bytes, generation: int) -> CachedResult:
+        entry = CachedResult(body, time.monotonic())
+        # GOTCHA: a feed can finish and clear the cache while the query is in flight,
+        # and caching its result then would serve pre-feed results until the TTL
+        if generation != self._generation:
+            return entry
+
+        self._entries[key] = entry
+        self._entries.move_to_end(key)
+        if len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+
+        return entry
+
+    def clear(self) -> None:
+        self._entries.clear()
+        self._generation += 1
@@ -0,0 +1,164 @@
+"""
+Facet counts materialised after each export by transformer/app/facets.py, for no
+filter and for each single label, so those requests don't need Vespa's grouping.
+
+The file is memory-mapped and read in place, and it's returned in the shape of the
+groups query's response. For the layout, see the writer.
+"""
+
+import logging
+import mmap
+from typing import NamedTuple
+
+from .filters import And, Expression, In
+
+MAGIC = 0x53544346  # "FCTS"
+VERSION = 1
+NO_LABEL = 0xFFFFFFFF
+
+GROUPS = ["label_types", "label_titles", "label_ids", "label_relationships"]
+HEADER_WORDS = 6
+FILTER_WORDS = 2 + 2 * len(GROUPS)
+
+logger = logging.getLogger(__name__)
+
+
+class MappedFacets(NamedTuple):
+    """One mapping of the facets file, never changed once it's read."""
+
+    offsets: memoryview
+    filters: memoryview
+    entries: memoryview
+    blob: memoryview
+    values: int
+    filter_count: int
+
+    @classmethod
+    def read(cls, path: str) -> "MappedFacets | None":
+        try:
+            with open(path, "rb") as f:
+                # GOTCHA: the writer replaces the file rather than rewriting it, so
+                # a mapping of the old one stays valid until it's dropped
+                mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except (FileNotFoundError, ValueError):
+            logger.warning("No facets at %s, grouping with Vespa", path)
+            return None
+
+        words = memoryview(mapped).cast("I")
+        magic, version, values, filters, blob_bytes, entries = words[:HEADER_WORDS]
+        if (magic, version) != (MAGIC, VERSION):
+            logger.warning("Unknown facets format in %s, grouping with Vespa", path)
+            return None
+
+        start = HEADER_WORDS
+        offsets = words[start : start + values + 1]
+        start += values + 1
+        filter_words = words[start : start + filters * FILTER_WORDS]
+        start += filters * FILTER_WORDS
+        entry_words = words[start : start + entries * 2]
+        start += entries * 2
+        blob = memoryview(mapped)[start * 4 : start * 4 + blob_bytes]
+        logger.info("Loaded %d facet filters from %s", filters, path)
+
+        return cls(offsets, filter_words, entry_words, blob, values, filters)
+
+    def value(self, index: int) -> str:
+        return bytes(self.blob[self.offsets[index] : self.offsets[index + 1]]).decode()
+
+    def value_index(self, value: str) -> int | None:
+        encoded = value.encode()
+        low, high = 0, self.values
+        while low < high:
+            middle = (low + high) // 2
+            candidate = bytes(
+                self.blob[self.offsets[middle] : self.offsets[middle + 1]]
+            )
+            if candidate < encoded:
+                low = middle + 1
+            elif candidate > encoded:
+                high = middle
+            else:
+                return middle
+
+        return None
+
+    def filter_start(self, label: int) -> int | None:
+        low, high = 0, self.filter_count
+        while low < high:
+            middle = (low + high) // 2
+            candidate = self.filters[middle * FILTER_WORDS]
+            if candidate < label:
+                low = middle + 1
+            elif candidate > label:
+                high = middle
+            else:
+                return middle * FILTER_WORDS
+
+        return None
+
+
+class Facets:
+    def __init__(self, path: str | None):
+        self.path = path
+        self._mapped: MappedFacets | None = None
+
+    def load(self) -> None:
+        """(Re)maps the file, or leaves grouping to Vespa if there isn't one."""
+        # GOTCHA: swapped in as one reference, so groups() sees either the old
+        # mapping or the new one, never a mix of the two
+        self._mapped = None if self.path is None else MappedFacets.read(self.path)
+
+    def groups(self, where: Expression) -> dict | None:
+        """The groups response for `where`, if it's materialised."""
+        mapped = self._mapped
+        if mapped is None:
+            return None
+        match where:
+            case And(()):
+                label = NO_LABEL
+            case In("label_ids", (value,)):
+                # GOTCHA: a label we don't know may have been fed since, so ask Vespa
+                if (label := mapped.value_index(value)) is None:
+                    return None
+            case _:
+                return None
+        if (start := mapped.filter_start(label)) is None:
+            return None
+
+        total = mapped.filters[start + 1]
+        children = []
+        for group, name in enumerate(GROUPS):
+            offset = mapped.filters[start + 2 + group * 2]
+            count = mapped.filters[start + 3 + group * 2]
+            entries = mapped.entries[offset * 2 : (offset + count) * 2]
+            children.append(
+                {
+                    "id": f"group:root:{group}",
+                    "relevance": 1.0,
+                    "children": [
+                        {
+                            "id": f"grouplist:{name}",
+                            "label": name,
+                            "relevance": 1.0,
+                            "children": [
+                                {
+                                    "id": f"group:string:{mapped.value(value)}",
+                                    "relevance": 1.0,
+                                    "value": mapped.value(value),
+                                    "fields": {"count()": documents},
+                                }
+                                for value, documents in zip(entries[::2], entries[1::2])
+                            ],
+                        }
+                    ],
+                }
+            )
+
+        return {
+            "root": {
+                "id": "toplevel",
+                "relevance": 1.0,
+                "fields": {"totalCount": total},
+                "children": children,
+            }
+        }
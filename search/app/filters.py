@@ -0,0 +1,265 @@
+"""
+Label and relationship filters as a small expression tree, compiled to YQL.
+
+The `labels` and `relationships` query params are flat lists of `[and:|or:]value`,
+read with `and` binding tighter than `or`. The `filter` query param takes a nested
+expression for anything they can't say, e.g.
+
+    label:"a" and (label:"b" or relationship:"topic") and not type:"Case"
+
+Expressions are normalised as they're built: nested ands and ors are flattened, and
+their operands deduplicated and sorted. An or of values on one field becomes a
+single `in`, rather than a `contains` per value. So the same filters written
+differently compile to the same YQL, and share an entry in the result cache.
+"""
+
+import re
+from dataclasses import dataclass
+from functools import lru_cache
+
+# field names in `filter` -> Vespa fields
+FIELDS = {
+    "label": "label_ids",
+    "relationship": "label_relationships",
+    "type": "label_types",
+    "title": "label_titles",
+}
+
+# compiled expressions kept, keyed by the normalised expression
+COMPILED_CACHE_SIZE = 1_024
+# parentheses and nots a `filter` can nest, as they're parsed and compiled recursively
+MAX_NESTING = 32
+# how deep an expression can be compiled, where each nesting in a `filter` can add
+# up to two levels (a not becomes `true and !(...)`)
+MAX_DEPTH = 2 * MAX_NESTING + 2
+
+
+@dataclass(frozen=True)
+class In:
+    """Matches documents with any of `values` in `field`."""
+
+    field: str
+    values: tuple[str, ...]
+
+
+@dataclass(frozen=True)
+class Not:
+    operand: "Expression"
+
+
+@dataclass(frozen=True)
+class And:
+    operands: tuple["Expression", ...]
+
+
+@dataclass(frozen=True)
+class Or:
+    operands: tuple["Expression", ...]
+
+
+Expression = In | Not | And | Or
+
+TRUE = And(())
+FALSE = Or(())
+
+
+def contains(field: str, value: str) -> In:
+    return In(field, (value,))
+
+
+def and_(*operands: Expression) -> Expression:
+    flattened: set[Expression] = set()
+    for operand in operands:
+        if operand == FALSE:
+            return FALSE
+        if isinstance(operand, And):
+            flattened.update(operand.operands)
+        else:
+            flattened.add(operand)
+
+    # GOTCHA: Vespa won't run a query that's only a negation, so a lone not stays
+    # wrapped, to compile to `true and !(...)`
+    if len(flattened) == 1 and not isinstance(next(iter(flattened)), Not):
+        return flattened.pop()
+    return And(tuple(sorted(flattened, key=repr)))
+
+
+def or_(*operands: Expression) -> Expression:
+    flattened: set[Expression] = set()
+    # field -> values, merged into one `in` per field
+    values: dict[str, set[str]] = {}
+    for operand in operands:
+        if operand == TRUE:
+            return TRUE
+        for inner in operand.operands if isinstance(operand, Or) else (operand,):
+            if isinstance(inner, In):
+                values.setdefault(inner.field, set()).update(inner.values)
+            else:
+                flattened.add(inner)
+    flattened.update(In(field, tuple(sorted(vs))) for field, vs in values.items())
+
+    if len(flattened) == 1:
+        return flattened.pop()
+    return Or(tuple(sorted(flattened, key=repr)))
+
+
+def not_(operand: Expression) -> Expression:
+    if isinstance(operand, And) and len(operand.operands) == 1:
+        operand = operand.operands[0]
+    if isinstance(operand, Not):
+        return operand.operand
+    return Not(operand)
+
+
+def quote(value: str) -> str:
+    escaped = value.replace("\\", "\\\\").replace('"', '\\"')
+    return f'"{escaped}"'
+
+
+def _to_yql(expression: Expression, depth: int = 0) -> str:
+    if depth > MAX_DEPTH:
+        raise ValueError(f"filter expression nested more than {MAX_DEPTH} deep")
+    match expression:
+        case In(field, (value,)):
+            return f"{field} contains {quote(value)}"
+        case In(field, values):
+            return f"{field} in ({', '.join(quote(value) for value in values)})"
+        case Not(operand):
+            return f"!({_to_yql(operand, depth + 1)})"
+        case And(()):
+            return "true"
+        case Or(()):
+            return "false"
+        case And(operands) | Or(operands):
+            joiner = " and " if isinstance(expression, And) else " or "
+            compiled = [
+                f"({_to_yql(operand, depth + 1)})"
+                if isinstance(operand, And | Or)
+                else _to_yql(operand, depth + 1)
+                for operand in operands
+            ]
+            if isinstance(expression, And) and all(
+                isinstance(operand, Not) for operand in operands
+            ):
+                compiled.insert(0, "true")
+            return joiner.join(compiled)
+
+    raise TypeError(f"not a filter expression: {expression!r}")
+
+
+@lru_cache(maxsize=COMPILED_CACHE_SIZE)
+def to_yql(expression: Expression) -> str:
+    """The YQL for a where clause matching `expression`."""
+    return _to_yql(expression)
+
+
+def parse_params(field: str, params: list[str]) -> Expression:
+    """Reads `labels` or `relationships` style params, e.g. ["a", "or:b", "and:c"]."""
+    # an or of ands, so that and binds tighter
+    terms: list[list[Expression]] = [[]]
+    for param in params:
+        match param.split(":", 1):
+            case [op, value] if op in {"and", "or"}:
+                pass
+            case _:
+                op, value = "and", param
+
+        # the operator on the first value doesn't matter
+        if op == "or" and terms[-1]:
+            terms.append([])
+        terms[-1].append(contains(field, value))
+
+    return or_(*(and_(*term) for term in terms))
+
+
+TOKEN = re.compile(
+    r"\s*(?:"
+    r"(?P<paren>[()])"
+    r"|(?P<keyword>and|or|not)\b"
+    r'|(?P<field>\w+):"(?P<value>(?:[^"\\]|\\.)*)"'
+    r")"
+)
+
+
+def tokenize(text: str) -> list[tuple[str, str, str]]:
+    tokens = []
+    position = 0
+    text = text.rstrip()
+    while position < len(text):
+        match = TOKEN.match(text, position)
+        if match is None:
+            raise ValueError(f"unexpected {text[position:].strip()[:20]!r} in filter")
+        position = match.end()
+        if match["paren"]:
+            tokens.append(("paren", match["paren"], ""))
+        elif match["keyword"]:
+            tokens.append(("keyword", match["keyword"], ""))
+        else:
+            value = re.sub(r"\\(.)", r"\1", match["value"])
+            tokens.append(("match", match["field"], value))
+
+    return tokens
+
+
+def parse_expression(text: str) -> Expression:
+    """
+    Reads a `filter` expression: `field:"value"` matches combined with and, or,
+    not and parentheses, where and binds tighter than or.
+    """
+    tokens = tokenize(text)
+    position = 0
+
+    def peek() -> tuple[str, str, str] | None:
+        return tokens[position] if position < len(tokens) else None
+
+    def take() -> tuple[str, str, str]:
+        nonlocal position
+        token = peek()
+        if token is None:
+            raise ValueError("unexpected end of filter")
+        position += 1
+        return token
+
+    def parse_or(depth: int) -> Expression:
+        operands = [parse_and(depth)]
+        while peek() == ("keyword", "or", ""):
+            take()
+            operands.append(parse_and(depth))
+        return or_(*operands)
+
+    def parse_and(depth: int) -> Expression:
+        operands = [parse_not(depth)]
+        while peek() == ("keyword", "and", ""):
+            take()
+            operands.append(parse_not(depth))
+        return and_(*operands)
+
+    def parse_not(depth: int) -> Expression:
+        # GOTCHA: each level is a few Python frames, so a deep enough filter would
+        # otherwise hit the recursion limit
+        if depth > MAX_NESTING:
+            raise ValueError(f"filter nested more than {MAX_NESTING} deep")
+        kind, name, value = take()
+        if (kind, name) == ("keyword", "not"):
+            return and_(not_(parse_not(depth + 1)))
+        if (kind, name) == ("paren", "("):
+            expression = parse_or(depth + 1)
+            if take() != ("paren", ")", ""):
+                raise ValueError("expected ) in filter")
+            return expression
+        if kind == "match":
+            if name not in FIELDS:
+                raise ValueError(
+                    f"unknown field {name!r} in filter, expected one of {list(FIELDS)}"
+                )
+            return contains(FIELDS[name], value)
+
+        raise ValueError(f"unexpected {name!r} in filter")
+
+    if not tokens:
+        return TRUE
+    expression = parse_or(0)
+    if peek() is not None:
+        raise ValueError(f"unexpected {peek()[1]!r} in filter")
+
+    return expression
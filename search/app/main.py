@@ -1,86 +1,170 @@
+import asyncio
+import time
+from contextlib import asynccontextmanager
 from unittest import result
 
-from fastapi import FastAPI, Query
+import httpx
+from fastapi import FastAPI, HTTPException, Query
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse, Response
 from vespa.application import Vespa
-
-vespa = Vespa(url="http://localhost:8081")
-
-
-app = FastAPI()
+from vespa.io import VespaQueryResponse
+
+from .cache import ResultCache
+from .facets import Facets
+from .filters import In, and_, not_, parse_expression, parse_params, to_yql
+from .metrics import (
+    groups_sources,
+    instrument_app,
+    observe_vespa_query,
+    record,
+    result_cache_lookups,
+    timed,
+    vespa_timeouts,
+)
+from .settings import settings
+
+vespa = Vespa(url=settings.vespa_url)
+
+# one pooled client for the whole process, opened and closed with the app
+vespa_client = vespa.asyncio(
+    connections=settings.vespa_connections,
+    timeout=httpx.Timeout(
+        settings.vespa_read_timeout, connect=settings.vespa_connect_timeout
+    ),
+    limits=httpx.Limits(
+        max_connections=settings.vespa_connections,
+        max_keepalive_connections=settings.vespa_connections,
+        keepalive_expiry=settings.vespa_keepalive_expiry,
+    ),
+)
+
+
+facets = Facets(settings.facets_path)
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    facets.load()
+    async with vespa_client:
+        yield
+
+
+app = FastAPI(lifespan=lifespan)
+instrument_app(app)
+
+result_cache = ResultCache(
+    max_size=settings.result_cache_size, ttl=settings.result_cache_ttl
+)
+
+
+async def query_vespa(name: str, yql: str, timeout: float) -> VespaQueryResponse:
+    started = time.perf_counter()
+    try:
+        # GOTCHA: pyvespa retries failed queries with backoff, so bound the whole
+        # thing, and tell Vespa so it stops working on the query too
+        async with asyncio.timeout(timeout):
+            response = await vespa_client.query(
+                body={"yql": yql, "timeout": f"{int(timeout * 1000)}ms"}
+            )
+    except TimeoutError:
+        vespa_timeouts.inc(query=name)
+        raise
+    finally:
+        record("vespa", time.perf_counter() - started)
+    elapsed = time.perf_counter() - started
+
+    hits = response.json.get("root", {}).get("fields", {}).get("totalCount", 0)
+    observe_vespa_query(name, elapsed, hits)
+    return response
+
+
+async def query_groups(yql: str) -> VespaQueryResponse:
+    try:
+        return await query_vespa("groups", yql, settings.groups_timeout)
+    except TimeoutError:
+        # the facets aren't worth failing the search for, so return no groups in the
+        # shape the frontend reads, with a status that keeps it out of the cache
+        return VespaQueryResponse(
+            json={"root": {"id": "toplevel", "relevance": 1.0, "children": []}},
+            status_code=504,
+            url=vespa.search_end_point,
+        )
 
 
 def group_query(group_name: str):
     return f"all(group({group_name}) max(10000) order(-count()) each(output(count())))"
 
 
+# TODO: this should be controlled via query params
+excluded_from_groups = not_(In("label_types", ("Case", "Family", "Project")))
+
+
 @app.get("/")
-def read_root(
+async def read_root(
     labels: list[str] = Query(default=[]),
     relationships: list[str] = Query(default=[]),
+    filter: str = Query(default="", max_length=10_000),
 ):
-    # region: labels
-    parsed_labels: list[tuple[str, str]] = []
-    for label in labels:
-        match label.split(":", 1):
-            case [op, title] if op in {"and", "or"}:
-                parsed_labels.append((op, title))
-            case _:
-                parsed_labels.append(("and", label))
-
-    labels_where = ""
-    if len(parsed_labels) == 0:
-        labels_where = "true"
-    elif len(parsed_labels) == 1:
-        labels_where = f"label_ids contains '{parsed_labels[0][1]}'"
-    elif len(parsed_labels) > 1:
-        conditions = [
-            (op, f"(label_ids contains '{label}')") for op, label in parsed_labels
-        ]
-
-        # The operator doesn't matter on the first
-        labels_where = conditions[0][1]
-        for op, condition in conditions[1:]:
-            labels_where = f"{labels_where} {op} {condition}"
-    # endregion
-
-    # region: relationships
-    parsed_relationships: list[tuple[str, str]] = []
-    for relationship in relationships:
-        match relationship.split(":", 1):
-            case [op, title] if op in {"and", "or"}:
-                parsed_relationships.append((op, title))
-            case _:
-                parsed_relationships.append(("and", relationship))
-
-    relationships_where = ""
-    if len(parsed_relationships) == 0:
-        relationships_where = "true"
-    elif len(parsed_relationships) == 1:
-        relationships_where = (
-            f"label_relationships contains '{parsed_relationships[0][1]}'"
+    try:
+        where = and_(
+            parse_params("label_ids", labels),
+            parse_params("label_relationships", relationships),
+            parse_expression(filter),
         )
-    elif len(parsed_relationships) > 1:
-        conditions = [
-            (op, f"(label_relationships contains '{relationship}')")
-            for op, relationship in parsed_relationships
-        ]
-
-        # The operator doesn't matter on the first
-        relationships_where = conditions[0][1]
-        for op, condition in conditions[1:]:
-            relationships_where = f"{relationships_where} {op} {condition}"
-    # endregion
-
-    
-    documents_yql = f"select * from sources * where ({labels_where}) and ({relationships_where}) limit 100;"
-    print(f"documents_yql: {documents_yql}")
-    documents_result = vespa.query(body={"yql": documents_yql})
-
-    # TODO: this should be controlled via query params
-    exclude_groups = ["Case", "Family", "Project"]
-    exclude_groups_yql = f"!({" or ".join([f"label_types contains '{group}'" for group in exclude_groups])})"
-    groups_yql = f"select * from sources * where ({labels_where}) and {exclude_groups_yql} and ({relationships_where}) limit 100 | {group_query('label_types')} | {group_query('label_titles')} | {group_query('label_ids')} | {group_query('label_relationships')};"
-    print(f"groups_yql: {groups_yql}")
-    groups_result = vespa.query(body={"yql": groups_yql})
-
-    return {"documents": documents_result, "groups": groups_result}
+    except ValueError as e:
+        raise HTTPException(status_code=422, detail=str(e))
+
+    if (cached := result_cache.get(where)) is not None:
+        result_cache_lookups.inc(result="hit")
+        return Response(cached.body, media_type="application/json")
+    result_cache_lookups.inc(result="miss")
+    generation = result_cache.generation()
+
+    documents_yql = f"select * from sources * where {to_yql(where)} limit 100;"
+
+    groups_where = to_yql(and_(where, excluded_from_groups))
+    groups_yql = f"select * from sources * where {groups_where} limit 100 | {group_query('label_types')} | {group_query('label_titles')} | {group_query('label_ids')} | {group_query('label_relationships')};"
+
+    with timed("facets"):
+        materialised = facets.groups(where)
+    groups_sources.inc(source="vespa" if materialised is None else "materialised")
+
+    # GOTCHA: the groups query excludes Case/Family/Project documents and the
+    # documents query doesn't, so they can't share one request. Run them side by side
+    # instead, so the latency is the slower of the two rather than the sum
+    try:
+        if materialised is None:
+            documents_result, groups_result = await asyncio.gather(
+                query_vespa("documents", documents_yql, settings.documents_timeout),
+                query_groups(groups_yql),
+            )
+        else:
+            documents_result = await query_vespa(
+                "documents", documents_yql, settings.documents_timeout
+            )
+            groups_result = VespaQueryResponse(
+                json=materialised, status_code=200, url=vespa.search_end_point
+            )
+    except TimeoutError:
+        raise HTTPException(status_code=504, detail="Vespa timed out")
+
+    response = JSONResponse(
+        jsonable_encoder({"documents": documents_result, "groups": groups_result})
+    )
+    # errors aren't cached, so the next request tries Vespa again
+    if documents_result.is_successful() and groups_result.is_successful():
+        result_cache.put(where, bytes(response.body), generation)
+
+    return response
+
+
+@app.post("/cache/invalidate", status_code=204)
+async def invalidate_result_cache():
+    """
+    Empties the result cache and reloads the facets, for after a feed changes
+    what's in Vespa. It runs on the event loop, like the searches that read them,
+    rather than in a threadpool alongside them.
+    """
+    facets.load()
+    result_cache.clear()
@@ -0,0 +1,191 @@
+"""
+Request and Vespa timings, hit counts and result cache lookups, exposed in the
+Prometheus text format on /metrics and per request in a Server-Timing header, so
+you can see where the time goes under load.
+
+Timings within a request are collected in a contextvar, which `timed` adds to
+wherever it runs.
+"""
+
+import time
+from bisect import bisect_left
+from collections import defaultdict
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Iterator
+
+from fastapi import FastAPI, Request
+from fastapi.responses import PlainTextResponse
+
+# seconds
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5)
+
+
+class Histogram:
+    def __init__(self, name: str, help: str, buckets: tuple[float, ...]):
+        self.name = name
+        self.help = help
+        self.buckets = buckets
+        # label values -> (count per bucket, sum, count)
+        self._series: dict[tuple[tuple[str, str], ...], list] = {}
+
+    def observe(self, value: float, **labels: str) -> None:
+        key = tuple(sorted(labels.items()))
+        series = self._series.get(key)
+        if series is None:
+            series = self._series[key] = [[0] * len(self.buckets), 0.0, 0]
+        index = bisect_left(self.buckets, value)
+        if index < len(self.buckets):
+            series[0][index] += 1
+        series[1] += value
+        series[2] += 1
+
+    def render(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        for key, (buckets, total, count) in self._series.items():
+            cumulative = 0
+            for bound, bucket in zip(self.buckets, buckets):
+                cumulative += bucket
+                lines.append(
+                    f"{self.name}_bucket{format_labels(key, le=str(bound))} {cumulative}"
+                )
+            lines.append(f"{self.name}_bucket{format_labels(key, le='+Inf')} {count}")
+            lines.append(f"{self.name}_sum{format_labels(key)} {total}")
+            lines.append(f"{self.name}_count{format_labels(key)} {count}")
+
+        return lines
+
+
+class Counter:
+    def __init__(self, name: str, help: str):
+        self.name = name
+        self.help = help
+        self._series: dict[tuple[tuple[str, str], ...], int] = {}
+
+    def inc(self, **labels: str) -> None:
+        key = tuple(sorted(labels.items()))
+        self._series[key] = self._series.get(key, 0) + 1
+
+    def render(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        for key, count in self._series.items():
+            lines.append(f"{self.name}{format_labels(key)} {count}")
+
+        return lines
+
+
+def format_labels(key: tuple[tuple[str, str], ...], **extra: str) -> str:
+    pairs = [*key, *extra.items()]
+    if not pairs:
+        return ""
+    escaped = (
+        (name, value.replace("\\", "\\\\").replace('"', '\\"')) for name, value in pairs
+    )
+    return "{" + ",".join(f'{name}="{value}"' for name, value in escaped) + "}"
+
+
+request_duration = Histogram(
+    "http_request_duration_seconds", "Time to the response headers", LATENCY_BUCKETS
+)
+vespa_duration = Histogram(
+    "vespa_query_duration_seconds", "Time per Vespa query", LATENCY_BUCKETS
+)
+vespa_hits = Histogram(
+    "vespa_query_hits",
+    "Documents matched by a Vespa query",
+    (0, 1, 10, 100, 1_000, 10_000, 100_000, 1_000_000),
+)
+vespa_timeouts = Counter(
+    "vespa_query_timeouts_total", "Vespa queries given up on after their timeout"
+)
+groups_sources = Counter(
+    "search_groups_total", "Groups served from materialised facets or by Vespa"
+)
+result_cache_lookups = Counter(
+    "search_result_cache_lookups_total", "Result cache lookups, by hit or miss"
+)
+
+# phase -> [count, seconds] for the current request
+request_timings: ContextVar[dict[str, list] | None] = ContextVar(
+    "request_timings", default=None
+)
+
+
+def record(phase: str, seconds: float) -> None:
+    timings = request_timings.get()
+    if timings is not None:
+        timings[phase][0] += 1
+        timings[phase][1] += seconds
+
+
+@contextmanager
+def timed(phase: str) -> Iterator[None]:
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        record(phase, time.perf_counter() - started)
+
+
+def observe_vespa_query(query: str, seconds: float, hits: int) -> None:
+    vespa_duration.observe(seconds, query=query)
+    vespa_hits.observe(hits, query=query)
+
+
+def server_timing(timings: dict[str, list], total: float) -> str:
+    metrics = [
+        f'{phase};dur={seconds * 1000:.1f};desc="{count}"'
+        for phase, (count, seconds) in timings.items()
+    ]
+    # whatever isn't accounted for: routing, validation, our own code. Phases that
+    # ran concurrently overlap, so this can't be told apart from them then
+    other = max(total - sum(seconds for _, seconds in timings.values()), 0.0)
+    metrics.append(f"app;dur={other * 1000:.1f}")
+    metrics.append(f"total;dur={total * 1000:.1f}")
+
+    return ", ".join(metrics)
+
+
+def instrument_app(app: FastAPI) -> None:
+    """Adds the timing middleware and the /metrics endpoint."""
+
+    @app.middleware("http")
+    async def timing_middleware(request: Request, call_next):
+        timings: dict[str, list] = defaultdict(lambda: [0, 0.0])
+        token = request_timings.set(timings)
+        started = time.perf_counter()
+        try:
+            response = await call_next(request)
+        finally:
+            request_timings.reset(token)
+        total = time.perf_counter() - started
+
+        # the route template rather than the path, to keep the label set small
+        route = request.scope.get("route")
+        request_duration.observe(
+            total,
+            method=request.method,
+            route=getattr(route, "path", "unmatched"),
+            status=str(response.status_code),
+        )
+        response.headers["Server-Timing"] = server_timing(timings, total)
+        # lets browsers show it for cross-origin requests too
+        response.headers["Timing-Allow-Origin"] = "*"
+
+        return response
+
+    @app.get("/metrics", response_class=PlainTextResponse, include_in_schema=False)
+    def metrics():
+        lines = []
+        for metric in [
+            request_duration,
+            vespa_duration,
+            vespa_hits,
+            vespa_timeouts,
+            groups_sources,
+            result_cache_lookups,
+        ]:
+            lines.extend(metric.render())
+        return PlainTextResponse(
+            "\n".join(lines) + "\n", media_type="text/plain; version=0.0.4"
+        )
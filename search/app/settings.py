@@ -0,0 +1,31 @@
+from pydantic_settings import BaseSettings, SettingsConfigDict
+
+
+class Settings(BaseSettings):
+    model_config = SettingsConfigDict(env_prefix="SEARCH_")
+
+    vespa_url: str = "http://localhost:8081"
+    # connections to Vespa kept open, each multiplexing requests over HTTP/2
+    vespa_connections: int = 10
+    # GOTCHA: Vespa resets connections idle for more than 30s
+    vespa_keepalive_expiry: float = 15.0
+    # seconds
+    vespa_connect_timeout: float = 2.0
+    vespa_read_timeout: float = 5.0
+    # for each query as a whole, retries included. Facets are the first to go, as
+    # the documents can be returned without them
+    documents_timeout: float = 5.0
+    groups_timeout: float = 2.0
+
+    # facet counts written by transformer/app/facets.py, served instead of asking
+    # Vespa to group when the filter is empty or a single label
+    facets_path: str | None = None
+
+    # search responses kept in memory per filter set, per process
+    result_cache_size: int = 1_000
+    # GOTCHA: the cache is only emptied when the feed calls POST /cache/invalidate,
+    # so this bounds how stale results can be after a feed that doesn't
+    result_cache_ttl: float = 300.0
+
+
+settings = Settings()
@@ -0,0 +1,91 @@
+"""
+Benchmarks GET / of one or more running search services, to compare latency between
+them (e.g. two revisions on different ports, both pointed at vespa_search_stub.py).
+
+    python benchmark.py --target before=http://localhost:8000 --target after=http://localhost:8010
+
+Each client runs the filters below in turn, over and over, for --duration seconds.
+"""
+
+import argparse
+import asyncio
+import statistics
+import time
+from dataclasses import dataclass, field
+
+import httpx
+
+# query params for GET /, from no filter to a few labels and relationships
+FILTERS = [
+    {},
+    {"labels": ["label-1"]},
+    {"labels": ["label-1", "label-2"]},
+    {"labels": ["label-1", "or:label-2"], "relationships": ["topic"]},
+]
+
+
+@dataclass
+class Results:
+    # seconds per request
+    latencies: list[float] = field(default_factory=list)
+    errors: int = 0
+
+    def report(self, name: str, elapsed: float) -> str:
+        quantiles = statistics.quantiles(self.latencies, n=100)
+        return (
+            f"{name:<12} {len(self.latencies) / elapsed:>8.0f} req/s"
+            f"  p50 {quantiles[49] * 1000:>7.1f}ms  p99 {quantiles[98] * 1000:>7.1f}ms"
+            f"  {self.errors} errors"
+        )
+
+
+async def request(client: httpx.AsyncClient, results: Results, params: dict) -> None:
+    started = time.perf_counter()
+    try:
+        response = await client.get("/", params=params)
+        response.raise_for_status()
+    except httpx.HTTPError:
+        results.errors += 1
+        return
+    results.latencies.append(time.perf_counter() - started)
+
+
+async def client_loop(
+    client: httpx.AsyncClient, results: Results, deadline: float
+) -> None:
+    while time.perf_counter() < deadline:
+        for params in FILTERS:
+            await request(client, results, params)
+
+
+async def run(url: str, concurrency: int, duration: float) -> Results:
+    results = Results()
+    limits = httpx.Limits(max_connections=concurrency)
+    async with httpx.AsyncClient(base_url=url, limits=limits, timeout=30.0) as client:
+        # one request first, so connection setup and warm-up aren't measured
+        await request(client, Results(), {})
+        deadline = time.perf_counter() + duration
+        await asyncio.gather(
+            *[client_loop(client, results, deadline) for _ in range(concurrency)]
+        )
+
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "--target",
+        action="append",
+        required=True,
+        help="name=url of a search service to test, can be repeated",
+    )
+    parser.add_argument("--concurrency", type=int, default=1)
+    parser.add_argument("--duration", type=float, default=20.0)
+    args = parser.parse_args()
+
+    print(f"{args.concurrency} clients, {args.duration:.0f}s per target")
+    for target in args.target:
+        name, url = target.split("=", 1)
+        results = asyncio.run(run(url, args.concurrency, args.duration))
+        print(results.report(name, args.duration))
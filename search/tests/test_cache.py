@@ -0,0 +1,34 @@
+from app.cache import ResultCache
+from app.filters import contains
+
+WHERE = contains("label_ids", "a")
+
+
+def test_put_is_cached():
+    cache = ResultCache(max_size=10, ttl=60)
+
+    cache.put(WHERE, b"result", cache.generation())
+
+    assert cache.get(WHERE).body == b"result"
+
+
+def test_put_after_a_clear_is_dropped():
+    cache = ResultCache(max_size=10, ttl=60)
+    # a search misses and queries Vespa, and a feed clears the cache meanwhile
+    generation = cache.generation()
+    cache.clear()
+
+    cache.put(WHERE, b"pre-feed result", generation)
+
+    assert cache.get(WHERE) is None
+    cache.put(WHERE, b"result", cache.generation())
+    assert cache.get(WHERE).body == b"result"
+
+
+def test_put_evicts_the_least_recently_used():
+    cache = ResultCache(max_size=2, ttl=60)
+    for value in ["a", "b", "c"]:
+        cache.put(contains("label_ids", value), value.encode(), cache.generation())
+
+    assert cache.get(contains("label_ids", "a")) is None
+    assert cache.get(contains("label_ids", "c")).body == b"c"
@@ -0,0 +1,121 @@
+"""
+Round trips facets files written by transformer/app/facets.py through the reader
+here, as the two sides of the format are written separately.
+"""
+
+import sys
+from collections import Counter
+from pathlib import Path
+
+import pytest
+
+from app.facets import GROUPS, Facets
+from app.filters import TRUE, and_, contains
+
+# the transformer's modules import each other as scripts
+sys.path.append(str(Path(__file__).parents[2] / "transformer" / "app"))
+from facets import write_facets
+
+# values per group, in the order of GROUPS
+DOCUMENTS = [
+    [["Genre", "Topic"], ["Law", "Forests"], ["Genre/Law", "Topic/Forests"], ["is"]],
+    [["Genre", "Topic"], ["Law", "Énergie"], ["Genre/Law", "Topic/Énergie"], ["is"]],
+    [["Genre"], ["Policy"], ["Genre/Policy"], ["is"]],
+    [["Topic", "Agent"], ["Forests", "UN"], ["Topic/Forests", "Agent/UN"], ["author"]],
+    # left out of the counts, as the groups query leaves these documents out
+    [["Family"], ["A family"], ["Family/1"], ["part_of"]],
+]
+
+
+def expected(label: str | None) -> dict:
+    matching = [
+        values
+        for values in DOCUMENTS[:-1]
+        if label is None or label in values[GROUPS.index("label_ids")]
+    ]
+    return {
+        "totalCount": len(matching),
+        "groups": [
+            Counter(value for values in matching for value in values[group])
+            for group in range(len(GROUPS))
+        ],
+    }
+
+
+def counts(groups: dict) -> dict:
+    return {
+        "totalCount": groups["root"]["fields"]["totalCount"],
+        "groups": [
+            Counter(
+                {
+                    value["value"]: value["fields"]["count()"]
+                    for value in child["children"][0]["children"]
+                }
+            )
+            for child in groups["root"]["children"]
+        ],
+    }
+
+
+@pytest.fixture
+def facets(tmp_path) -> Facets:
+    facets_file = str(tmp_path / "facets.bin")
+    write_facets(DOCUMENTS, facets_file)
+    facets = Facets(facets_file)
+    facets.load()
+    return facets
+
+
+def test_no_filter_reads_back_the_written_counts(facets):
+    assert counts(facets.groups(TRUE)) == expected(None)
+
+
+@pytest.mark.parametrize(
+    "label", ["Genre/Law", "Topic/Forests", "Topic/Énergie", "Agent/UN"]
+)
+def test_single_label_reads_back_the_written_counts(facets, label):
+    assert counts(facets.groups(contains("label_ids", label))) == expected(label)
+
+
+def test_values_are_ordered_by_count(facets):
+    titles = facets.groups(TRUE)["root"]["children"][GROUPS.index("label_titles")]
+    values = [
+        (value["fields"]["count()"], value["value"])
+        for value in titles["children"][0]["children"]
+    ]
+
+    assert values == sorted(values, key=lambda value: (-value[0], value[1]))
+
+
+@pytest.mark.parametrize(
+    "where",
+    [
+        contains("label_ids", "Topic/Unknown"),
+        and_(
+            contains("label_ids", "Genre/Law"), contains("label_ids", "Topic/Forests")
+        ),
+        contains("label_relationships", "is"),
+    ],
+)
+def test_filters_that_arent_materialised_go_to_vespa(facets, where):
+    assert facets.groups(where) is None
+
+
+def test_reload_swaps_in_the_new_file(facets):
+    write_facets(DOCUMENTS[:1], facets.path)
+    facets.load()
+
+    assert facets.groups(TRUE)["root"]["fields"]["totalCount"] == 1
+
+
+@pytest.mark.parametrize(
+    "content", [None, b"", b"\0" * 64], ids=["missing", "empty", "unknown format"]
+)
+def test_unreadable_files_go_to_vespa(tmp_path, content):
+    facets_file = tmp_path / "facets.bin"
+    if content is not None:
+        facets_file.write_bytes(content)
+    facets = Facets(str(facets_file))
+    facets.load()
+
+    assert facets.groups(TRUE) is None
@@ -0,0 +1,97 @@
+import pytest
+from fastapi.testclient import TestClient
+
+from app.filters import (
+    MAX_NESTING,
+    And,
+    In,
+    Not,
+    and_,
+    contains,
+    not_,
+    or_,
+    parse_expression,
+    parse_params,
+    to_yql,
+)
+from app.main import app
+
+
+def test_quotes_and_backslashes_stay_inside_the_value():
+    where = parse_expression(r'label:"a\" or true" and label:"b\\"')
+
+    assert where == and_(
+        contains("label_ids", 'a" or true'), contains("label_ids", "b\\")
+    )
+    assert to_yql(where) == (
+        r'label_ids contains "a\" or true" and label_ids contains "b\\"'
+    )
+
+
+def test_params_and_binds_tighter_than_or():
+    where = parse_params("label_ids", ["a", "and:b", "or:c", "and:d"])
+
+    assert where == or_(
+        and_(contains("label_ids", "a"), contains("label_ids", "b")),
+        and_(contains("label_ids", "c"), contains("label_ids", "d")),
+    )
+
+
+def test_expression_and_binds_tighter_than_or():
+    where = parse_expression('label:"a" or label:"b" and label:"c"')
+
+    assert where == or_(
+        contains("label_ids", "a"),
+        and_(contains("label_ids", "b"), contains("label_ids", "c")),
+    )
+
+
+def test_or_of_values_on_one_field_is_one_in():
+    where = parse_expression('label:"b" or label:"a" or relationship:"topic"')
+
+    assert to_yql(where) == (
+        'label_ids in ("a", "b") or label_relationships contains "topic"'
+    )
+
+
+@pytest.mark.parametrize(
+    "reordered",
+    [
+        ["b", "a"],
+        ["a", "b", "a"],
+        ["and:b", "a", "b"],
+    ],
+)
+def test_reordered_and_duplicated_labels_are_the_same_expression(reordered):
+    where = parse_params("label_ids", ["a", "b"])
+
+    assert parse_params("label_ids", reordered) == where
+    assert to_yql(parse_params("label_ids", reordered)) == to_yql(where)
+    assert parse_expression('label:"b" and label:"a" and label:"b"') == where
+
+
+def test_lone_not_keeps_a_positive_term():
+    where = parse_expression('not type:"Case"')
+
+    assert where == And((Not(In("label_types", ("Case",))),))
+    assert to_yql(where) == 'true and !(label_types contains "Case")'
+    assert not_(not_(contains("label_types", "Case"))) == contains(
+        "label_types", "Case"
+    )
+
+
+@pytest.mark.parametrize("opening", ["(", "not "])
+def test_nesting_is_limited(opening):
+    def nested(depth: int) -> str:
+        return opening * depth + 'label:"a"' + ")" * opening.count("(") * depth
+
+    parse_expression(nested(MAX_NESTING))
+    with pytest.raises(ValueError):
+        parse_expression(nested(MAX_NESTING + 1))
+
+
+def test_too_deep_a_filter_is_a_422():
+    filter = "(" * (MAX_NESTING + 1) + 'label:"a"' + ")" * (MAX_NESTING + 1)
+    response = TestClient(app).get("/", params={"filter": filter})
+
+    assert response.status_code == 422
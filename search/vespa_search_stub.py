@@ -0,0 +1,109 @@
+"""
+A stand-in for Vespa's /search/ endpoint, so the search service can be benchmarked
+without a Vespa cluster. Queries with a grouping (a `|` in the YQL) get a grouping
+response in the shape Vespa returns, the rest get a page of hits, each after a fixed
+delay to stand in for Vespa's own latency.
+
+pyvespa's async client only speaks HTTP/2, so serve it with hypercorn (in the dev
+dependency group), which accepts HTTP/2 over plain TCP:
+
+    hypercorn vespa_search_stub:app --bind localhost:8081
+
+The delays are set with VESPA_STUB_DOCUMENTS_LATENCY and VESPA_STUB_GROUPS_LATENCY
+(in seconds).
+"""
+
+import asyncio
+
+from fastapi import FastAPI, Request
+from pydantic_settings import BaseSettings, SettingsConfigDict
+
+
+class Settings(BaseSettings):
+    model_config = SettingsConfigDict(env_prefix="VESPA_STUB_")
+
+    documents_latency: float = 0.02
+    # grouping has to visit every match, so it's the slower of the two
+    groups_latency: float = 0.05
+    total_count: int = 1_000
+
+
+settings = Settings()
+
+app = FastAPI()
+
+GROUPS = ["label_types", "label_titles", "label_ids", "label_relationships"]
+
+
+def hit(index: int) -> dict:
+    return {
+        "id": f"id:documents:document::document-{index}",
+        "relevance": 0.0,
+        "source": "documents",
+        "fields": {
+            "id": f"document-{index}",
+            "title": f"Document {index}",
+            "label_ids": [f"label-{index % 7}", f"label-{index % 11}"],
+            "label_relationships": ["jurisdiction", "topic"],
+        },
+    }
+
+
+def documents_response(limit: int) -> dict:
+    return {
+        "root": {
+            "id": "toplevel",
+            "relevance": 1.0,
+            "fields": {"totalCount": settings.total_count},
+            "coverage": {"coverage": 100, "documents": settings.total_count},
+            "children": [hit(index) for index in range(min(limit, 100))],
+        }
+    }
+
+
+def groups_response() -> dict:
+    return {
+        "root": {
+            "id": "toplevel",
+            "relevance": 1.0,
+            "fields": {"totalCount": settings.total_count},
+            "coverage": {"coverage": 100, "documents": settings.total_count},
+            "children": [
+                {
+                    "id": f"group:root:{index}",
+                    "relevance": 1.0,
+                    "continuation": {"this": ""},
+                    "children": [
+                        {
+                            "id": f"grouplist:{name}",
+                            "label": name,
+                            "relevance": 1.0,
+                            "children": [
+                                {
+                                    "id": f"group:string:{name}-{value}",
+                                    "relevance": 1.0,
+                                    "value": f"{name}-{value}",
+                                    "fields": {
+                                        "count()": settings.total_count >> value
+                                    },
+                                }
+                                for value in range(10)
+                            ],
+                        }
+                    ],
+                }
+                for index, name in enumerate(GROUPS)
+            ],
+        }
+    }
+
+
+@app.post("/search/")
+async def search(request: Request):
+    body = await request.json()
+    if "|" in body.get("yql", ""):
+        await asyncio.sleep(settings.groups_latency)
+        return groups_response()
+
+    await asyncio.sleep(settings.documents_latency)
+    return documents_response(100)
@@ -0,0 +1,298 @@
+"""
+Benchmarks NavigatorTransformer against a synthetic navigator object graph.
+
+The generator builds PhysicalDocument --> FamilyDocument --> Family -->
+Corpus/CorpusType/Geography/FamilyMetadata graphs in memory, batch by batch, with
+document types taken from valid_metadata/ and roughly the corpus mix of production.
+No database is needed, and the same seed always gives the same corpus.
+
+Each run reports docs/sec per rule, for resolving the rule inputs, and end to end
+(transform + serialise a feed line), plus memory per rule and peak RSS. Results
+are appended to .data/benchmarks.jsonl and compared with the previous run at the
+same scale, so regressions show up.
+
+    python benchmark.py --scale 100k
+"""
+
+import argparse
+import json
+import os
+import random
+import resource
+import subprocess
+import time
+import tracemalloc
+from datetime import datetime
+from itertools import islice, product
+from typing import Iterator
+
+from main import VespaPutDocument, vespa_id
+from models import (
+    Corpus,
+    CorpusType,
+    Family,
+    FamilyDocument,
+    FamilyDocumentStatus,
+    FamilyMetadata,
+    Geography,
+    PhysicalDocument,
+)
+from navigator_transformer import NavigatorTransformer
+
+VALID_METADATA_DIR = os.path.join(
+    os.path.dirname(__file__), "..", "..", "valid_metadata"
+)
+
+# valid_metadata file, corpus type name, share of documents
+CORPUS_TYPES = [
+    ("laws-and-policies", "Laws and Policies", 0.55),
+    ("litigation", "Litigation", 0.15),
+    ("reports", "Reports", 0.10),
+    ("intl-agreements", "Intl. agreements", 0.05),
+    ("gcf", "GCF", 0.06),
+    ("gef", "GEF", 0.04),
+    ("cif", "CIF", 0.03),
+    ("af", "AF", 0.02),
+]
+
+
+def parse_scale(scale: str) -> int:
+    multipliers = {"k": 1_000, "m": 1_000_000}
+    if scale[-1].lower() in multipliers:
+        return int(float(scale[:-1]) * multipliers[scale[-1].lower()])
+    return int(scale)
+
+
+def document_types(valid_metadata_file: str) -> list[str]:
+    with open(os.path.join(VALID_METADATA_DIR, f"{valid_metadata_file}.json")) as f:
+        valid_metadata = json.load(f)
+    return valid_metadata["_document"].get("type", {}).get("allowed_values", [])
+
+
+def generate_documents(
+    count: int, batch_size: int, seed: int = 0
+) -> Iterator[list[PhysicalDocument]]:
+    rng = random.Random(seed)
+    corpora = []
+    for valid_metadata_file, name, share in CORPUS_TYPES:
+        corpus_type = CorpusType(name=name, description=name)
+        corpus = Corpus(
+            import_id=f"CCLW.corpus.{valid_metadata_file}.n0000",
+            title=name,
+            corpus_type_name=name,
+            organisation_id=1,
+            corpus_type=corpus_type,
+        )
+        corpora.append((corpus, document_types(valid_metadata_file), share))
+    weights = [share for _, _, share in corpora]
+
+    geographies = [
+        Geography(id=i, display_value=code, value=code, type="ISO-3166", slug=code)
+        for i, code in enumerate(
+            "".join(letters) for letters in islice(product("ABCDEFGHIJ", repeat=3), 200)
+        )
+    ]
+    authors = [f"Author {i}" for i in range(2_000)]
+
+    batch = []
+    document_id = 0
+    family_id = 0
+    while document_id < count:
+        corpus, types, _ = rng.choices(corpora, weights)[0]
+        metadata = {}
+        if corpus.corpus_type_name in {"Reports", "Intl. agreements"}:
+            # a long tail of authors, most of them rare
+            metadata["author"] = [
+                authors[min(int(rng.paretovariate(1.2)) - 1, len(authors) - 1)]
+                for _ in range(rng.randint(1, 3))
+            ]
+        family = Family(
+            import_id=f"CCLW.family.{family_id}.0",
+            title=f"Family {family_id}",
+            description="",
+            family_category="Executive",
+            corpus=corpus,
+            unparsed_geographies=rng.sample(geographies, rng.choice([1, 1, 1, 2, 5])),
+            unparsed_metadata=FamilyMetadata(
+                family_import_id=f"CCLW.family.{family_id}.0", value=metadata
+            ),
+        )
+        family_id += 1
+
+        for _ in range(min(rng.randint(1, 5), count - document_id)):
+            valid_metadata = {}
+            if types:
+                # the odd CSV value, as in production
+                valid_metadata["type"] = [
+                    ",".join(rng.sample(types, rng.choice([1] * 9 + [2])))
+                ]
+            batch.append(
+                PhysicalDocument(
+                    id=document_id,
+                    title=f"Document {document_id}",
+                    md5_sum=None,
+                    source_url="https://example.org",
+                    content_type="application/pdf",
+                    cdn_object=None,
+                    family_document=FamilyDocument(
+                        import_id=f"CCLW.document.{document_id}.0",
+                        variant_name=None,
+                        document_status=FamilyDocumentStatus.PUBLISHED,
+                        family_import_id=family.import_id,
+                        family=family,
+                        physical_document_id=document_id,
+                        valid_metadata=valid_metadata,
+                    ),
+                )
+            )
+            document_id += 1
+
+            if len(batch) == batch_size:
+                yield batch
+                batch = []
+
+    if batch:
+        yield batch
+
+
+def benchmark_rules(count: int, batch_size: int) -> dict[str, dict]:
+    """docs/sec resolving the rule inputs, and for each rule on its own (no memo)."""
+    transformer = NavigatorTransformer()
+    rule_set = transformer.rule_set
+    timings = {"resolve": 0.0} | {rule.label: 0.0 for rule in transformer.rules}
+    for batch in generate_documents(count, batch_size):
+        started = time.perf_counter()
+        values = [rule_set.values(row) for row in batch]
+        timings["resolve"] += time.perf_counter() - started
+
+        for rule, inputs in zip(transformer.rules, rule_set.inputs):
+            started = time.perf_counter()
+            for row_values in values:
+                rule(transformer, *(row_values[input] for input in inputs))
+            timings[rule.label] += time.perf_counter() - started
+
+    return {
+        name: {"docs_per_sec": count / elapsed} for name, elapsed in timings.items()
+    }
+
+
+def measure_rule_memory(count: int, results: dict[str, dict]) -> None:
+    """tracemalloc is slow, so this runs on its own (smaller) sample."""
+    transformer = NavigatorTransformer()
+    rule_set = transformer.rule_set
+    batch = next(generate_documents(count, count))
+    values = [rule_set.values(row) for row in batch]
+
+    tracemalloc.start()
+    for rule, inputs in zip(transformer.rules, rule_set.inputs):
+        tracemalloc.reset_peak()
+        before, _ = tracemalloc.get_traced_memory()
+        output = [
+            rule(transformer, *(row_values[input] for input in inputs))
+            for row_values in values
+        ]
+        current, peak = tracemalloc.get_traced_memory()
+        results[rule.label]["peak_bytes_per_doc"] = (peak - before) / count
+        results[rule.label]["retained_bytes_per_doc"] = (current - before) / count
+        del output
+    tracemalloc.stop()
+
+
+def benchmark_end_to_end(count: int, batch_size: int) -> dict:
+    transformer = NavigatorTransformer()
+    generating = 0.0
+    started = time.perf_counter()
+    documents = generate_documents(count, batch_size)
+    while True:
+        generate_started = time.perf_counter()
+        batch = next(documents, None)
+        generating += time.perf_counter() - generate_started
+        if batch is None:
+            break
+
+        for documents_model in transformer.transform_batch(batch):
+            VespaPutDocument(
+                put=vespa_id(documents_model.id),
+                fields=documents_model.model_dump(),
+            ).model_dump_json()
+
+    elapsed = time.perf_counter() - started - generating
+    return {
+        "docs_per_sec": count / elapsed,
+        # ru_maxrss is in kilobytes on Linux
+        "peak_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+    }
+
+
+def git_revision() -> str | None:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def previous_run(results_file: str, count: int) -> dict | None:
+    if not os.path.exists(results_file):
+        return None
+
+    previous = None
+    with open(results_file, encoding="utf-8") as f:
+        for line in f:
+            run = json.loads(line)
+            if run["documents"] == count:
+                previous = run
+    return previous
+
+
+def main(scale: str, batch_size: int, memory_sample: int, results_file: str):
+    count = parse_scale(scale)
+    results = benchmark_rules(count, batch_size)
+    measure_rule_memory(min(count, memory_sample), results)
+    results["end_to_end"] = benchmark_end_to_end(count, batch_size)
+
+    run = {
+        "timestamp": datetime.now().isoformat(),
+        "revision": git_revision(),
+        "documents": count,
+        "batch_size": batch_size,
+        "results": results,
+    }
+    previous = previous_run(results_file, count)
+
+    print(f"{count} documents, batch size {batch_size}")
+    for name, result in results.items():
+        line = f"  {name:<16} {result['docs_per_sec']:>12,.0f} docs/s"
+        if previous and name in previous["results"]:
+            change = result["docs_per_sec"] / previous["results"][name]["docs_per_sec"]
+            line += f" ({change - 1:+.0%} vs {previous['revision'] or previous['timestamp']})"
+            if change < 0.9:
+                line += " REGRESSION"
+        for key in ["peak_bytes_per_doc", "retained_bytes_per_doc", "peak_rss_mb"]:
+            if key in result:
+                line += f", {key} {result[key]:,.0f}"
+        print(line)
+
+    os.makedirs(os.path.dirname(results_file), exist_ok=True)
+    with open(results_file, "a", encoding="utf-8") as f:
+        f.write(json.dumps(run) + "\n")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--scale", default="10k", help="documents, e.g. 10k, 100k, 1m")
+    parser.add_argument("--batch-size", type=int, default=1000)
+    parser.add_argument(
+        "--memory-sample",
+        type=int,
+        default=10_000,
+        help="documents used for the (slow) per-rule memory measurements",
+    )
+    parser.add_argument("--results-file", default=".data/benchmarks.jsonl")
+    args = parser.parse_args()
+
+    main(args.scale, args.batch_size, args.memory_sample, args.results_file)
@@ -1,8 +1,20 @@
-from sqlmodel import Field, Relationship, SQLModel
+from sqlmodel import Field, Index, Relationship, SQLModel
 from datetime import datetime
 
 
 class Label(SQLModel, table=True):
+    __table_args__ = (
+        # browsing labels by type, in id order
+        Index("ix_label_type_id", "type", "id"),
+        # prefix and substring search on titles, needs the pg_trgm extension
+        Index(
+            "ix_label_title_trgm",
+            "title",
+            postgresql_using="gin",
+            postgresql_ops={"title": "gin_trgm_ops"},
+        ),
+    )
+
     id: str | None = Field(default=None, primary_key=True)
     title: str
     type: str
@@ -10,6 +22,11 @@ class Label(SQLModel, table=True):
 
 
 class DocumentLabelLink(SQLModel, table=True):
+    # the primary key leads with document_id, so lookups by label need their own
+    __table_args__ = (
+        Index("ix_documentlabellink_label_id", "label_id", "document_id"),
+    )
+
     document_id: str = Field(foreign_key="document.id", primary_key=True)
     label_id: str = Field(foreign_key="label.id", primary_key=True)
     relationship: str
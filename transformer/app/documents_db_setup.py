@@ -7,4 +7,7 @@ documents_engine = create_engine(
     echo=True,
 )
 
+with documents_engine.begin() as connection:
+    connection.execute(text("CREATE EXTENSION IF NOT EXISTS pg_trgm"))
+
 SQLModel.metadata.create_all(documents_engine)
@@ -0,0 +1,197 @@
+"""
+Materialises the facet counts that the search service would otherwise get from
+Vespa's grouping. It covers the filters most traffic uses: no filter, and each
+single label. Run after each export. The counts are written to a compact binary
+file that the search service memory-maps (see search/app/facets.py).
+
+Counts follow the search service's groups query. Case, Family and Project documents
+are left out. For each of label_types, label_titles, label_ids and
+label_relationships, it's the number of documents with each value, most first, up
+to 10,000 values.
+
+A delta feed only says what changed. So each run also keeps every document's values
+in a snapshot next to the facets file, for the next delta to be applied to:
+
+- "full" treats the feed as the whole corpus, and starts a new snapshot
+- "delta" applies the feed's puts and removes to the last snapshot
+
+The file is native-endian (little on everything we run) uint32 words:
+
+    magic, version, value count V, filter count F, blob bytes B, entry count E
+    V + 1 offsets into the blob, one string per value, sorted
+    F filters of 10 words, sorted by label: the label's value index (NO_LABEL for
+      no filter), the matching document count, then an (entry offset, entry count)
+      per group
+    E entries of (value index, document count)
+    the UTF-8 blob, padded to a whole word
+"""
+
+import argparse
+import json
+import os
+import time
+from array import array
+from collections import Counter
+from typing import Iterable, Literal
+
+from documents_loader import read_feed
+
+FacetsMode = Literal["full", "delta"]
+
+MAGIC = 0x53544346  # "FCTS"
+VERSION = 1
+NO_LABEL = 0xFFFFFFFF
+
+# in the order of the groups query, so group:root:0 is label_types
+GROUPS = ["label_types", "label_titles", "label_ids", "label_relationships"]
+LABEL_TYPES = GROUPS.index("label_types")
+LABEL_IDS = GROUPS.index("label_ids")
+# as max(10000) in the groups query
+MAX_GROUP_VALUES = 10_000
+EXCLUDED_TYPES = {"Case", "Family", "Project"}
+
+# vespa id -> values per group
+Snapshot = dict[str, list[list[str]]]
+
+
+def document_values(fields: dict) -> list[list[str]]:
+    labels = fields["labels"]
+    return [
+        sorted({label["label"]["type"] for label in labels}),
+        sorted({label["label"]["title"] for label in labels}),
+        sorted({label["label"]["id"] for label in labels}),
+        sorted({label["relationship"] for label in labels}),
+    ]
+
+
+def apply_feed(snapshot: Snapshot, feed_file: str) -> int:
+    operations = 0
+    for operation in read_feed(feed_file):
+        if "remove" in operation:
+            snapshot.pop(operation["remove"], None)
+        else:
+            snapshot[operation["put"]] = document_values(operation["fields"])
+        operations += 1
+
+    return operations
+
+
+def write_facets(documents: Iterable[list[list[str]]], facets_file: str) -> int:
+    """Writes the counts for `documents`, returning how many filters it wrote."""
+    documents = [
+        values
+        for values in documents
+        if not EXCLUDED_TYPES.intersection(values[LABEL_TYPES])
+    ]
+
+    # GOTCHA: sorting str sorts by code point, which is also UTF-8 byte order, so
+    # the reader can binary search the blob
+    strings = sorted(
+        {value for values in documents for group in values for value in group}
+    )
+    index = {value: i for i, value in enumerate(strings)}
+    encoded = [
+        [[index[value] for value in group] for group in values] for values in documents
+    ]
+
+    # label -> the documents that have it
+    labelled: dict[int, list[int]] = {}
+    for document, values in enumerate(encoded):
+        for label in values[LABEL_IDS]:
+            labelled.setdefault(label, []).append(document)
+
+    filters = array("I")
+    entries = array("I")
+
+    def add_filter(label: int, matching: list[int]) -> None:
+        filters.extend((label, len(matching)))
+        for group in range(len(GROUPS)):
+            counts = Counter(
+                value for document in matching for value in encoded[document][group]
+            )
+            top = sorted(counts.items(), key=lambda item: (-item[1], item[0]))
+            top = top[:MAX_GROUP_VALUES]
+            filters.extend((len(entries) // 2, len(top)))
+            for value, count in top:
+                entries.extend((value, count))
+
+    for label in sorted(labelled):
+        add_filter(label, labelled[label])
+    # last, as NO_LABEL sorts after every value index
+    add_filter(NO_LABEL, list(range(len(encoded))))
+
+    blob = bytearray()
+    offsets = array("I", [0])
+    for value in strings:
+        blob += value.encode("utf-8")
+        offsets.append(len(blob))
+    blob_bytes = len(blob)
+    blob += b"\0" * (-len(blob) % 4)
+
+    header = array(
+        "I",
+        [
+            MAGIC,
+            VERSION,
+            len(strings),
+            len(filters) // 10,
+            blob_bytes,
+            len(entries) // 2,
+        ],
+    )
+    # GOTCHA: the search service maps the old file, so it's replaced rather than
+    # rewritten in place
+    with open(facets_file + ".tmp", "wb") as f:
+        for part in [header, offsets, filters, entries]:
+            part.tofile(f)
+        f.write(blob)
+    os.replace(facets_file + ".tmp", facets_file)
+
+    return len(filters) // 10
+
+
+def materialise_facets(
+    feed_file: str,
+    mode: FacetsMode,
+    facets_file: str = ".data/facets.bin",
+) -> None:
+    started = time.perf_counter()
+    snapshot_file = facets_file.removesuffix(".bin") + ".snapshot.json"
+
+    snapshot: Snapshot = {}
+    if mode == "delta":
+        if not os.path.exists(snapshot_file):
+            raise FileNotFoundError(
+                f"no snapshot at {snapshot_file} to apply {feed_file} to, "
+                "materialise a full feed first"
+            )
+        with open(snapshot_file, encoding="utf-8") as f:
+            snapshot = json.load(f)
+
+    operations = apply_feed(snapshot, feed_file)
+    filters = write_facets(snapshot.values(), facets_file)
+
+    with open(snapshot_file + ".tmp", "w", encoding="utf-8") as f:
+        json.dump(snapshot, f)
+    os.replace(snapshot_file + ".tmp", snapshot_file)
+
+    print(
+        f"Materialised {filters} facet filters for {len(snapshot)} docs from "
+        f"{operations} operations in {feed_file} ({mode}) to {facets_file} in "
+        f"{time.perf_counter() - started:.1f}s ({os.path.getsize(facets_file)} bytes)"
+    )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("feed_file", nargs="?", default=".data/documents.jsonl")
+    parser.add_argument(
+        "--mode",
+        choices=["full", "delta"],
+        default="full",
+        help="full starts from the feed alone, delta applies it to the last snapshot",
+    )
+    parser.add_argument("--facets-file", default=".data/facets.bin")
+    args = parser.parse_args()
+
+    materialise_facets(args.feed_file, args.mode, args.facets_file)
@@ -4,6 +4,7 @@ from typing import Any, Optional
 
 from pydantic import computed_field
 from sqlalchemy.dialects.postgresql import ARRAY, JSONB
+from sqlalchemy.orm import joinedload, selectinload
 from sqlmodel import Column, Field, Relationship, SQLModel
 
 
@@ -569,3 +570,25 @@ class PhysicalDocumentPublic(PhysicalDocumentBase):
 
 
 # endregion
+
+
+# region: Loader options
+"""
+The transformer rules walk PhysicalDocument --> FamilyDocument --> Family and out to
+the corpus, geographies and metadata for every document. Left lazy, that is several
+SELECTs per document. These options load the whole graph for a batch up front:
+joined loads for the many-to-one hops and select-in loads for the collections, so the
+number of queries is fixed per batch rather than per document.
+"""
+physical_document_export_options = [
+    joinedload(PhysicalDocument.family_document)  # type: ignore[arg-type]
+    .joinedload(FamilyDocument.family)  # type: ignore[arg-type]
+    .options(
+        joinedload(Family.corpus).joinedload(Corpus.corpus_type),  # type: ignore[arg-type]
+        joinedload(Family.unparsed_metadata),  # type: ignore[arg-type]
+        selectinload(Family.unparsed_geographies),  # type: ignore[arg-type]
+    ),
+]
+
+
+# endregion
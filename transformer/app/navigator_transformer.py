@@ -1,25 +1,61 @@
+from collections import OrderedDict
 from datetime import datetime
 from functools import wraps
-from typing import Callable, Protocol, TypeVar
+from typing import Any, Callable, Hashable, Iterable, Protocol, TypeVar
 
 from models import PhysicalDocument
 from pydantic import BaseModel
+from rule_engine import RuleSet, hashable
 
 
-def rule(mermaid: str):
+def rule(source: str | tuple[str, ...], label: str):
+    """
+    `source` is the dotted path (or paths) from the transformer's root model that the
+    rule reads, and `label` the type of label it produces. The rule is called with the
+    resolved value of each path, so its output depends on nothing else.
+    """
+
     def decorator(func):
         @wraps(func)
         def wrapper(*args, **kwargs):
             return func(*args, **kwargs)
 
         # Store metadata on the function
-        wrapper.mermaid = mermaid
+        wrapper.source = (source,) if isinstance(source, str) else source
+        wrapper.label = label
 
         return wrapper
 
     return decorator
 
 
+def label_rule(source: str, type: str, relationship: str, split: str | None = None):
+    """A rule that maps each value at `source` straight to a label of `type`."""
+
+    @rule(source=source, label=type)
+    def mapping(self, values: Any) -> list[LabelRelationship]:
+        if values is None:
+            return []
+        if isinstance(values, str):
+            values = (values,)
+
+        labels = []
+        for value in values:
+            for title in value.split(split) if split else (value,):
+                labels.append(
+                    self.label_relationship(
+                        id=f"{type}/{title}",
+                        title=title,
+                        type=type,
+                        relationship=relationship,
+                    )
+                )
+
+        return labels
+
+    return mapping
+
+
 TransformerIn = TypeVar("TransformerIn")
 
 
@@ -41,14 +77,14 @@ class LabelledDocument(BaseModel):
     labels: list[LabelRelationship]
 
 
-Rule = Callable[[TransformerIn], list[LabelRelationship]]
+Rule = Callable[..., list[LabelRelationship]]
 
 
 class LabelledDocumentTransformer(Protocol[TransformerIn]):
-    @rule(mermaid="")
     def transform(self, data_in: TransformerIn) -> LabelledDocument: ...
 
     rules: list[Rule]
+    rule_set: RuleSet
 
 
 class NavigatorTransformer:
@@ -60,189 +96,207 @@ class NavigatorTransformer:
         "GEF": "Global Environment Facility",
     }
 
-    @rule(
-        mermaid="PhysicalDocument --> FamilyDocument --> Family --> .name --> CollectionTypeLabel.title"
-    )
-    def event(self, data_in: PhysicalDocument) -> list[LabelRelationship]:
+    def __init__(self, timestamp: datetime | None = None, cache_size: int = 10_000):
+        # one timestamp for the whole run, rather than one per label
+        self.timestamp = timestamp or datetime.now()
+        # id -> label, and (id, relationship) -> label relationship, least recently
+        # used first
+        self._labels: OrderedDict[str, Label] = OrderedDict()
+        self._label_relationships: OrderedDict[tuple[str, str], LabelRelationship] = (
+            OrderedDict()
+        )
+        # (rule index, rule inputs) -> labels, least recently used first
+        self._rule_labels: OrderedDict[
+            tuple[int, tuple[Hashable, ...]], list[LabelRelationship]
+        ] = OrderedDict()
+        self.cache_size = cache_size
+
+    def label_relationship(
+        self, id: str, title: str, type: str, relationship: str
+    ) -> LabelRelationship:
+        """
+        The same few labels repeat across thousands of documents, so they are built
+        (and validated) once and shared. Treat the returned objects as immutable.
+        """
+        key = (id, relationship)
+        label_relationship = self._label_relationships.get(key)
+        if label_relationship is None:
+            label = self._labels.get(id)
+            if label is None:
+                label = self._labels[id] = Label(id=id, title=title, type=type)
+                if len(self._labels) > self.cache_size:
+                    self._labels.popitem(last=False)
+            else:
+                self._labels.move_to_end(id)
+            label_relationship = self._label_relationships[key] = LabelRelationship(
+                label=label, relationship=relationship, timestamp=self.timestamp
+            )
+            if len(self._label_relationships) > self.cache_size:
+                self._label_relationships.popitem(last=False)
+        else:
+            self._label_relationships.move_to_end(key)
+
+        return label_relationship
+
+    @rule(source=(), label="Event")
+    def event(self) -> list[LabelRelationship]:
         return []
 
     @rule(
-        mermaid="PhysicalDocument --> FamilyDocument --> Family --> .name --> CollectionTypeLabel.title"
+        source=(
+            "family_document.family.corpus.corpus_type.name",
+            "family_document.family.import_id",
+            "family_document.family.title",
+        ),
+        label="Family",
     )
-    def family(self, data_in: PhysicalDocument) -> list[LabelRelationship]:
-        corpus_type_name = data_in.family_document.family.corpus.corpus_type.name
+    def family(
+        self, corpus_type_name: str, family_import_id: str, family_title: str
+    ) -> list[LabelRelationship]:
         labels = []
         if corpus_type_name in self.corporate_finance_projects:
             labels.append(
-                LabelRelationship(
-                    label=Label(
-                        id=f"Project/{data_in.family_document.family.import_id}",
-                        title=data_in.family_document.family.title,
-                        type="Project",
-                    ),
+                self.label_relationship(
+                    id=f"Project/{family_import_id}",
+                    title=family_title,
+                    type="Project",
                     relationship="part_of",
-                    timestamp=datetime.now().isoformat(),
                 )
             )
 
         if corpus_type_name == "Litigation":
             labels.append(
-                LabelRelationship(
-                    label=Label(
-                        id=f"Case/{data_in.family_document.family.import_id}",
-                        title=data_in.family_document.family.title,
-                        type="Case",
-                    ),
+                self.label_relationship(
+                    id=f"Case/{family_import_id}",
+                    title=family_title,
+                    type="Case",
                     relationship="part_of",
-                    timestamp=datetime.now().isoformat(),
                 )
             )
 
         labels.append(
-            LabelRelationship(
-                label=Label(
-                    id=f"Family/{data_in.family_document.family.import_id}",
-                    title=data_in.family_document.family.name,
-                    type="Family",
-                ),
+            self.label_relationship(
+                id=f"Family/{family_import_id}",
+                title=family_title,
+                type="Family",
                 relationship="part_of",
-                timestamp=datetime.now().isoformat(),
             )
         )
 
         return labels
 
-    @rule(
-        mermaid="PhysicalDocument --> FamilyDocument --> Family --> Corpus --> CorpusType -- .name --> GenreLabel.title"
-    )
-    def genre(self, data_in: PhysicalDocument) -> list[LabelRelationship]:
-        corpus_type_name = data_in.family_document.family.corpus.corpus_type.name
-
+    @rule(source="family_document.family.corpus.corpus_type.name", label="Genre")
+    def genre(self, corpus_type_name: str) -> list[LabelRelationship]:
         if corpus_type_name in self.corporate_finance_projects:
             return [
-                LabelRelationship(
-                    label=Label(
-                        id="Genre/Corporate Finance Project",
-                        title="Corporate Finance Project",
-                        type="Genre",
-                    ),
+                self.label_relationship(
+                    id="Genre/Corporate Finance Project",
+                    title="Corporate Finance Project",
+                    type="Genre",
                     relationship="is",
-                    timestamp=datetime.now().isoformat(),
                 ),
-                LabelRelationship(
-                    label=Label(
-                        id=f"MultilateralClimateFund/{self.corporate_finance_project_names[corpus_type_name]}",
-                        title=self.corporate_finance_project_names[corpus_type_name],
-                        type="MultilateralClimateFund",
-                    ),
+                self.label_relationship(
+                    id=f"MultilateralClimateFund/{self.corporate_finance_project_names[corpus_type_name]}",
+                    title=self.corporate_finance_project_names[corpus_type_name],
+                    type="MultilateralClimateFund",
                     relationship="part_of",
-                    timestamp=datetime.now().isoformat(),
                 ),
             ]
 
         return [
-            LabelRelationship(
-                label=Label(
-                    id=f"Genre/{corpus_type_name}",
-                    title=corpus_type_name,
-                    type="Genre",
-                ),
+            self.label_relationship(
+                id=f"Genre/{corpus_type_name}",
+                title=corpus_type_name,
+                type="Genre",
                 relationship="is",
-                timestamp=datetime.now().isoformat(),
             )
         ]
 
-    @rule(
-        mermaid="PhysicalDocument --> FamilyDocument -- .valid_metadata.type --> DocumentTypeLabel.title"
+    # Most values are singular, but we have used CSVs as singular values to immitate
+    # multi values previously. Splitting on "," unwinds that hack.
+    # e.g.
+    #     Nationally Determined Contribution,National Communication
+    #     Pre-Session Document,Synthesis Report
+    #     National Communication,Biennial Report
+    #     Nationally Determined Contribution,National Communication
+    #     National Adaptation Plan,Adaptation Communication
+    #     Publication,Report
+    document_type = label_rule(
+        source="family_document.valid_metadata.type",
+        type="DocumentType",
+        relationship="is",
+        split=",",
     )
-    def document_type(self, data_in: PhysicalDocument) -> list[LabelRelationship]:
-        valid_metadata_document_types = data_in.family_document.valid_metadata.get(
-            "type", []
-        )
-
-        document_types = []
-        for valid_metadata_document_type in valid_metadata_document_types:
-            """
-            Most values are singular, but we have used CSVs as singular values to immitate
-            multi values previously. This unwinds that hack.
-            e.g.
-                Nationally Determined Contribution,National Communication
-                Pre-Session Document,Synthesis Report
-                National Communication,Biennial Report
-                Nationally Determined Contribution,National Communication
-                National Adaptation Plan,Adaptation Communication
-                Publication,Report
-            """
-            doc_types = valid_metadata_document_type.split(",")
-            for doc_type in doc_types:
-                document_types.append(
-                    LabelRelationship(
-                        label=Label(
-                            id=f"DocumentType/{doc_type}",
-                            title=doc_type,
-                            type="DocumentType",
-                        ),
-                        relationship="is",
-                        timestamp=datetime.now().isoformat(),
-                    )
-                )
 
-        return document_types
+    geography = label_rule(
+        source="family_document.family.unparsed_geographies.value",
+        type="Geography",
+        relationship="is",
+    )
 
-    @rule(
-        mermaid="PhysicalDocument --> FamilyDocument --> Family --> Geography -- .value --> GeographyLabel.title"
+    author = label_rule(
+        source="family_document.family.unparsed_metadata.value.author",
+        type="Agent",
+        relationship="author",
     )
-    def geography(self, data_in: PhysicalDocument) -> list[LabelRelationship]:
-        geographies = []
-        for geography in data_in.family_document.family.unparsed_geographies:
-            geographies.append(
-                LabelRelationship(
-                    label=Label(
-                        id=f"Geography/{geography.value}",
-                        title=geography.value,
-                        type="Geography",
-                    ),
-                    relationship="is",
-                    timestamp=datetime.now().isoformat(),
-                )
-            )
 
-        return geographies
+    rules = [genre, document_type, geography, author]
+    rule_set = RuleSet(PhysicalDocument, rules)
+
+    def labels(self, values: tuple[Hashable, ...]) -> list[LabelRelationship]:
+        """
+        Rules only see the values they declared, so their output is memoised on those
+        values: a family's labels are computed once for all its documents, and a
+        genre once for the whole corpus.
+        """
+        labels = []
+        for i, (rule, inputs) in enumerate(zip(self.rules, self.rule_set.inputs)):
+            key = (i, tuple(values[input] for input in inputs))
+            rule_labels = self._rule_labels.get(key)
+            if rule_labels is None:
+                rule_labels = self._rule_labels[key] = rule(self, *key[1])
+                if len(self._rule_labels) > self.cache_size:
+                    self._rule_labels.popitem(last=False)
+            else:
+                self._rule_labels.move_to_end(key)
+            labels.extend(rule_labels)
 
-    @rule(
-        mermaid="PhysicalDocument --> FamilyDocument --> Family --> FamilyMetadata -- .author --> AuthorLabel.title"
-    )
-    def author(self, data_in: PhysicalDocument) -> list[LabelRelationship]:
-        authors = []
-        for author in data_in.family_document.family.unparsed_metadata.value.get(
-            "author", []
-        ):
-            authors.append(
-                LabelRelationship(
-                    label=Label(
-                        id=f"Agent/{author}",
-                        title=author,
-                        type="Agent",
-                    ),
-                    relationship="author",
-                    timestamp=datetime.now().isoformat(),
-                )
+        return labels
+
+    def transform_batch(
+        self, data_in: Iterable[PhysicalDocument]
+    ) -> list[LabelledDocument]:
+        return [
+            LabelledDocument(
+                id=str(row.id),
+                title=row.title,
+                labels=self.labels(self.rule_set.values(row)),
             )
+            for row in data_in
+        ]
 
-        return authors
+    def transform_rows(self, rows: Iterable[Any]) -> list[LabelledDocument]:
+        """Transforms rows of `select()`, where the rule set was pushed down to SQL."""
+        return [
+            LabelledDocument(
+                id=str(row[0]),
+                title=row[1],
+                labels=self.labels(tuple(hashable(value) for value in row[2:])),
+            )
+            for row in rows
+        ]
 
-    rules = [genre, document_type, geography, author]
+    @classmethod
+    def select(cls):
+        """The rule set pushed down to SQL, for `transform_rows`."""
+        return cls.rule_set.select(PhysicalDocument.id, PhysicalDocument.title)
 
     def transform(self, data_in: PhysicalDocument) -> LabelledDocument:
-        labels = []
-        for rule in self.rules:
-            labels.extend(rule(self, data_in))
-
-        return LabelledDocument(id=str(data_in.id), title=data_in.title, labels=labels)
+        return self.transform_batch([data_in])[0]
 
 
 def generate_mermaid_diagram(transformer: LabelledDocumentTransformer) -> str:
-    mermaid_rules = [getattr(rule, "mermaid", "") for rule in transformer.rules]
+    mermaid_rules = transformer.rule_set.mermaid()
     mermaid_rules_with_tabs = [f"    {rule}" for rule in mermaid_rules if rule]
 
     initialise_mermaid = [
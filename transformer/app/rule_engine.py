@@ -0,0 +1,150 @@
+"""
+Rules declare the data they read as dotted paths from a root model, e.g.
+"family_document.family.corpus.corpus_type.name" from PhysicalDocument.
+
+That makes a rule set compilable: each distinct path is resolved once per row, either
+by walking loaded ORM objects or by pushing the whole rule set down into one SQL
+query, and each rule is a function of the values it declared rather than of the row.
+"""
+
+from typing import Any, Hashable, Sequence
+
+from sqlalchemy import ColumnElement, Select, String, func, inspect, select
+from sqlalchemy.dialects.postgresql import aggregate_order_by, array
+from sqlalchemy.orm import Mapper, RelationshipProperty, aliased
+
+
+def hashable(value: Any) -> Hashable:
+    # JSONB arrays and relationship collections come back as lists
+    if isinstance(value, list):
+        return tuple(hashable(item) for item in value)
+    return value
+
+
+def resolve(value: Any, path: Sequence[str]) -> Hashable:
+    for i, segment in enumerate(path):
+        if value is None:
+            return None
+        if isinstance(value, list):
+            # GOTCHA: collections load in no particular order, so they're sorted as
+            # RuleSet.select's array_agg sorts them
+            return tuple(sorted(resolve(item, path[i:]) for item in value))
+        if isinstance(value, dict):
+            value = value.get(segment)
+        else:
+            value = getattr(value, segment)
+
+    return hashable(value)
+
+
+class RuleSet:
+    def __init__(self, root: type, rules: Sequence[Any]):
+        self.root = root
+        self.rules = rules
+        # each distinct path once, however many rules read it
+        self.paths = list(dict.fromkeys(path for rule in rules for path in rule.source))
+        self.inputs = [
+            tuple(self.paths.index(path) for path in rule.source) for rule in rules
+        ]
+
+    def values(self, row: Any) -> tuple[Hashable, ...]:
+        return tuple(resolve(row, path.split(".")) for path in self.paths)
+
+    def select(self, *columns: Any) -> Select:
+        """
+        One query selecting `columns` followed by a column per path. Many-to-one hops
+        become outer joins (shared between paths with a common prefix), collections
+        become correlated array_agg subqueries and anything past a JSONB column is
+        a key lookup.
+        """
+        joins: dict[str, tuple[Any, Any]] = {}
+        path_columns = [self._column(path, joins) for path in self.paths]
+
+        query = select(*columns, *path_columns).select_from(self.root)
+        for onclause, _ in joins.values():
+            query = query.outerjoin(onclause)
+
+        return query
+
+    def _column(self, path: str, joins: dict[str, tuple[Any, Any]]) -> ColumnElement:
+        segments = path.split(".")
+        entity: Any = self.root
+        mapper: Mapper = inspect(self.root)
+        for i, segment in enumerate(segments):
+            relationship = mapper.relationships.get(segment)
+            if relationship is None:
+                column = getattr(entity, segment)
+                for key in segments[i + 1 :]:
+                    column = column[key]
+                return column
+
+            if relationship.uselist:
+                return self._aggregate(entity, relationship, segments[i + 1 :])
+
+            prefix = ".".join(segments[: i + 1])
+            if prefix not in joins:
+                target = aliased(relationship.mapper.class_)
+                joins[prefix] = (getattr(entity, segment).of_type(target), target)
+            _, entity = joins[prefix]
+            mapper = relationship.mapper
+
+        raise ValueError(f"{path} does not end in a column")
+
+    def _aggregate(
+        self,
+        parent: Any,
+        relationship: RelationshipProperty,
+        segments: Sequence[str],
+    ) -> ColumnElement:
+        if len(segments) != 1:
+            raise ValueError(
+                f"{relationship} can only be followed by a column, not {segments}"
+            )
+
+        inner_parent = aliased(relationship.parent.class_)
+        target = aliased(relationship.mapper.class_)
+        column = getattr(target, segments[0])
+        # GOTCHA: in code point order, as Python sorts the ORM's collections, rather
+        # than the database's collation
+        order = column.collate("C") if isinstance(column.type, String) else column
+        primary_key = [
+            relationship.parent.get_property_by_column(c).key
+            for c in relationship.parent.primary_key
+        ]
+        values = (
+            select(func.array_agg(aggregate_order_by(column, order)))
+            .select_from(inner_parent)
+            .join(getattr(inner_parent, relationship.key).of_type(target))
+            .where(
+                *[
+                    getattr(inner_parent, key) == getattr(parent, key)
+                    for key in primary_key
+                ]
+            )
+            .scalar_subquery()
+        )
+
+        # match the ORM, where an empty collection is an empty list rather than None
+        return func.coalesce(values, array([], type_=column.type))
+
+    def mermaid(self) -> list[str]:
+        lines = []
+        for rule in self.rules:
+            for path in rule.source:
+                lines.append(self._mermaid(path, rule.label))
+
+        return lines
+
+    def _mermaid(self, path: str, label: str) -> str:
+        segments = path.split(".")
+        mapper: Mapper = inspect(self.root)
+        nodes = [mapper.class_.__name__]
+        for i, segment in enumerate(segments):
+            relationship = mapper.relationships.get(segment)
+            if relationship is None:
+                attribute = ".".join(segments[i:])
+                return f"{' --> '.join(nodes)} -- .{attribute} --> {label}Label.title"
+            mapper = relationship.mapper
+            nodes.append(mapper.class_.__name__)
+
+        return f"{' --> '.join(nodes)} --> {label}Label.title"
@@ -0,0 +1,198 @@
+"""
+Feeds a JSONL feed file (as written by main.py) into Vespa's /document/v1 API.
+
+The file is read as a stream into a bounded queue, and a fixed number of workers
+share one pooled HTTP client, so memory and concurrency stay flat whatever the size
+of the feed. 429s and 503s are Vespa asking us to slow down, so those (and
+connection errors) are retried with exponential backoff.
+
+Pass --search-url to empty the search service's result cache, and reload its facets,
+once the feed is done.
+
+Run vespa_stub.py to feed without a Vespa instance.
+"""
+
+import argparse
+import asyncio
+import json
+import random
+import statistics
+import time
+from dataclasses import dataclass, field
+from urllib.parse import quote
+
+import httpx
+
+RETRY_STATUS_CODES = {429, 503}
+
+
+@dataclass
+class FeedStats:
+    ok: int = 0
+    failed: int = 0
+    retries: int = 0
+    started: float = field(default_factory=time.perf_counter)
+    # latencies since the last report, in seconds
+    window: list[float] = field(default_factory=list)
+
+    def report(self, final: bool = False) -> str:
+        elapsed = time.perf_counter() - self.started
+        done = self.ok + self.failed
+        summary = (
+            f"{done} ops ({self.ok} ok, {self.failed} failed, {self.retries} retries) "
+            f"in {elapsed:.1f}s, {done / elapsed:.0f} ops/s"
+        )
+        if len(self.window) >= 2:
+            quantiles = statistics.quantiles(self.window, n=100)
+            summary += (
+                f", p50 {quantiles[49] * 1000:.1f}ms p99 {quantiles[98] * 1000:.1f}ms"
+            )
+        if not final:
+            self.window = []
+
+        return summary
+
+
+def document_path(document_id: str) -> str:
+    # id:<namespace>:<document type>::<user specified>
+    _, namespace, document_type, _, user_specified = document_id.split(":", 4)
+    return f"/document/v1/{namespace}/{document_type}/docid/{quote(user_specified, safe='')}"
+
+
+def to_request(operation: dict) -> tuple[str, str, dict | None]:
+    if "put" in operation:
+        return "POST", document_path(operation["put"]), {"fields": operation["fields"]}
+    if "update" in operation:
+        body = {"fields": operation["fields"]}
+        if operation.get("create"):
+            body["create"] = True
+        return "PUT", document_path(operation["update"]), body
+    if "remove" in operation:
+        return "DELETE", document_path(operation["remove"]), None
+
+    raise ValueError(f"unknown feed operation {list(operation)}")
+
+
+async def send(
+    client: httpx.AsyncClient,
+    operation: dict,
+    stats: FeedStats,
+    max_retries: int,
+) -> None:
+    try:
+        method, path, body = to_request(operation)
+    except (KeyError, ValueError) as error:
+        # GOTCHA: one bad line mustn't take its worker down, or the feed never ends
+        stats.failed += 1
+        print(f"{json.dumps(operation)[:200]} failed: {error!r}")
+        return
+
+    for attempt in range(max_retries + 1):
+        started = time.perf_counter()
+        try:
+            response = await client.request(method, path, json=body)
+            retry = response.status_code in RETRY_STATUS_CODES
+        except httpx.TransportError:
+            response = None
+            retry = True
+
+        if not retry:
+            stats.window.append(time.perf_counter() - started)
+            if response is not None and response.is_success:
+                stats.ok += 1
+            else:
+                stats.failed += 1
+                print(f"{method} {path} failed: {response.status_code} {response.text}")
+            return
+
+        if attempt < max_retries:
+            stats.retries += 1
+            # full jitter, so that throttled workers don't retry in lockstep
+            await asyncio.sleep(random.uniform(0, min(10.0, 0.1 * 2**attempt)))
+
+    stats.failed += 1
+    print(f"{method} {path} failed after {max_retries} retries")
+
+
+async def worker(
+    client: httpx.AsyncClient,
+    queue: asyncio.Queue,
+    stats: FeedStats,
+    max_retries: int,
+) -> None:
+    while (operation := await queue.get()) is not None:
+        await send(client, operation, stats, max_retries)
+
+
+async def reporter(stats: FeedStats, interval: float) -> None:
+    while True:
+        await asyncio.sleep(interval)
+        print(stats.report())
+
+
+async def feed(
+    feed_file: str,
+    url: str,
+    concurrency: int = 64,
+    max_retries: int = 10,
+    report_interval: float = 5.0,
+) -> FeedStats:
+    stats = FeedStats()
+    limits = httpx.Limits(
+        max_connections=concurrency, max_keepalive_connections=concurrency
+    )
+    async with httpx.AsyncClient(
+        base_url=url, limits=limits, timeout=httpx.Timeout(30.0)
+    ) as client:
+        queue: asyncio.Queue = asyncio.Queue(maxsize=concurrency * 2)
+        workers = [
+            asyncio.create_task(worker(client, queue, stats, max_retries))
+            for _ in range(concurrency)
+        ]
+        report = asyncio.create_task(reporter(stats, report_interval))
+
+        with open(feed_file, encoding="utf-8") as f:
+            for line in f:
+                if line.strip():
+                    await queue.put(json.loads(line))
+        for _ in workers:
+            await queue.put(None)
+
+        await asyncio.gather(*workers)
+        report.cancel()
+
+    print(f"Fed {feed_file}: {stats.report(final=True)}")
+    return stats
+
+
+def invalidate_search_cache(search_url: str) -> None:
+    response = httpx.post(f"{search_url}/cache/invalidate")
+    response.raise_for_status()
+    print(f"Invalidated the result cache at {search_url}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("feed_file", nargs="?", default=".data/documents.jsonl")
+    parser.add_argument("--url", default="http://localhost:8081")
+    parser.add_argument("--concurrency", type=int, default=64)
+    parser.add_argument("--max-retries", type=int, default=10)
+    parser.add_argument("--report-interval", type=float, default=5.0)
+    parser.add_argument(
+        "--search-url",
+        help="search service whose result cache and facets to refresh after feeding",
+    )
+    args = parser.parse_args()
+
+    stats = asyncio.run(
+        feed(
+            args.feed_file,
+            args.url,
+            concurrency=args.concurrency,
+            max_retries=args.max_retries,
+            report_interval=args.report_interval,
+        )
+    )
+    # GOTCHA: even a partly failed feed has changed what's in Vespa
+    if args.search_url and stats.ok:
+        invalidate_search_cache(args.search_url)
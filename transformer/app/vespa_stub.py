@@ -0,0 +1,90 @@
+"""
+An in-memory stand-in for Vespa's /document/v1 API, for testing and benchmarking
+vespa_feeder.py offline.
+
+    VESPA_STUB_LATENCY=0.005 VESPA_STUB_THROTTLE_RATE=0.05 fastapi run vespa_stub.py --port 8082
+    python vespa_feeder.py --url http://localhost:8082
+"""
+
+import asyncio
+import random
+
+from fastapi import Body, FastAPI
+from fastapi.responses import JSONResponse
+from pydantic_settings import BaseSettings, SettingsConfigDict
+
+
+class Settings(BaseSettings):
+    model_config = SettingsConfigDict(env_prefix="VESPA_STUB_")
+
+    # seconds added to every request
+    latency: float = 0.0
+    # fraction of requests answered with a 429, as Vespa does when it's overloaded
+    throttle_rate: float = 0.0
+
+
+settings = Settings()
+documents: dict[str, dict] = {}
+
+app = FastAPI()
+
+DOCUMENT_PATH = "/document/v1/{namespace}/{document_type}/docid/{user_specified}"
+
+
+async def respond(namespace: str, document_type: str, user_specified: str):
+    if settings.latency:
+        await asyncio.sleep(settings.latency)
+    if random.random() < settings.throttle_rate:
+        return JSONResponse(status_code=429, content={"message": "Rejecting execution"})
+
+    return {
+        "pathId": f"/document/v1/{namespace}/{document_type}/docid/{user_specified}",
+        "id": f"id:{namespace}:{document_type}::{user_specified}",
+    }
+
+
+@app.post(DOCUMENT_PATH)
+async def put_document(
+    namespace: str, document_type: str, user_specified: str, body: dict = Body()
+):
+    response = await respond(namespace, document_type, user_specified)
+    if not isinstance(response, JSONResponse):
+        documents[response["id"]] = body["fields"]
+    return response
+
+
+@app.put(DOCUMENT_PATH)
+async def update_document(
+    namespace: str, document_type: str, user_specified: str, body: dict = Body()
+):
+    response = await respond(namespace, document_type, user_specified)
+    if isinstance(response, JSONResponse):
+        return response
+
+    if response["id"] not in documents:
+        if not body.get("create"):
+            return JSONResponse(status_code=404, content=response)
+        documents[response["id"]] = {}
+    for name, update in body["fields"].items():
+        documents[response["id"]][name] = update["assign"]
+
+    return response
+
+
+@app.delete(DOCUMENT_PATH)
+async def remove_document(namespace: str, document_type: str, user_specified: str):
+    response = await respond(namespace, document_type, user_specified)
+    if not isinstance(response, JSONResponse):
+        documents.pop(response["id"], None)
+    return response
+
+
+@app.get(DOCUMENT_PATH)
+async def get_document(namespace: str, document_type: str, user_specified: str):
+    response = await respond(namespace, document_type, user_specified)
+    if isinstance(response, JSONResponse):
+        return response
+
+    if response["id"] not in documents:
+        return JSONResponse(status_code=404, content=response)
+    return {**response, "fields": documents[response["id"]]}
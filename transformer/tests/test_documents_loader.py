@@ -0,0 +1,99 @@
+"""
+Loads against a real Postgres. Set DOCUMENTS_TEST_DATABASE_URL to a database the
+tests may empty the documents tables of. They're created if they're missing, which
+needs the pg_trgm extension (see documents_db_setup.py).
+"""
+
+import json
+import os
+
+import pytest
+from sqlmodel import SQLModel, create_engine, text
+
+import documents_loader
+from document_models import Document, DocumentLabelLink, Label
+
+DATABASE_URL = os.environ.get("DOCUMENTS_TEST_DATABASE_URL")
+TABLES = [Label.__table__, Document.__table__, DocumentLabelLink.__table__]
+
+pytestmark = pytest.mark.skipif(
+    DATABASE_URL is None, reason="DOCUMENTS_TEST_DATABASE_URL isn't set"
+)
+
+
+@pytest.fixture
+def documents_engine(monkeypatch):
+    engine = create_engine(DATABASE_URL)
+    SQLModel.metadata.create_all(engine, tables=TABLES)
+    with engine.begin() as connection:
+        connection.execute(
+            text(f"TRUNCATE {', '.join(table.name for table in TABLES)}")
+        )
+    monkeypatch.setattr(documents_loader, "documents_engine", engine)
+
+    yield engine
+    engine.dispose()
+
+
+def put(id: str, title: str, labels: list[tuple[str, str, str]]) -> dict:
+    return {
+        "put": f"id:production:documents::{id}",
+        "fields": {
+            "id": id,
+            "title": title,
+            "labels": [
+                {
+                    "label": {"id": label_id, "title": label_title, "type": label_type},
+                    "relationship": "is",
+                    "timestamp": "2024-01-01T00:00:00",
+                }
+                for label_id, label_title, label_type in labels
+            ],
+        },
+    }
+
+
+def write_feed(feed_file, operations: list[dict]) -> str:
+    feed_file.write_text("\n".join(json.dumps(operation) for operation in operations))
+    return str(feed_file)
+
+
+def test_load_keeps_empty_titles(documents_engine, tmp_path):
+    feed_file = write_feed(
+        tmp_path / "documents.jsonl",
+        [
+            put("1", "", [("Topic/", "", "Topic")]),
+            put("2", "Two", [("Topic/", "", "Topic"), ("Genre/Law", "Law", "Genre")]),
+        ],
+    )
+
+    documents_loader.load_feed(feed_file, "full")
+
+    with documents_engine.connect() as connection:
+        documents = dict(
+            connection.execute(text("SELECT id, title FROM document")).all()
+        )
+        labels = dict(connection.execute(text("SELECT id, title FROM label")).all())
+    assert documents == {"1": "", "2": "Two"}
+    assert labels == {"Topic/": "", "Genre/Law": "Law"}
+
+
+def test_reload_leaves_unchanged_rows_alone(documents_engine, tmp_path):
+    feed_file = write_feed(
+        tmp_path / "documents.jsonl",
+        [put("1", "", [("Topic/", "", "Topic")]), put("2", "Two", [])],
+    )
+    # xmin is the transaction that last wrote the row
+    versions = text(
+        "SELECT 'document', id, xmin::text FROM document "
+        "UNION ALL SELECT 'label', id, xmin::text FROM label"
+    )
+
+    documents_loader.load_feed(feed_file, "full")
+    with documents_engine.connect() as connection:
+        loaded = set(connection.execute(versions).all())
+    documents_loader.load_feed(feed_file, "full")
+    with documents_engine.connect() as connection:
+        reloaded = set(connection.execute(versions).all())
+
+    assert reloaded == loaded
@@ -0,0 +1,134 @@
+"""
+Export query counts against a real Postgres, seeded with the benchmark's synthetic
+navigator graph. Set NAVIGATOR_TEST_DATABASE_URL to a database the tests may drop
+and recreate the navigator tables in, e.g.
+
+    NAVIGATOR_TEST_DATABASE_URL=postgresql://postgres@localhost:5432/navigator_test \
+        uv run pytest
+"""
+
+import json
+import os
+from datetime import datetime
+
+import pytest
+from sqlalchemy import event
+from sqlmodel import Session, SQLModel, create_engine
+
+import main
+from benchmark import generate_documents
+from document_models import Document, DocumentLabelLink, Label
+from models import Organisation
+
+DATABASE_URL = os.environ.get("NAVIGATOR_TEST_DATABASE_URL")
+DOCUMENTS = 500
+
+pytestmark = pytest.mark.skipif(
+    DATABASE_URL is None, reason="NAVIGATOR_TEST_DATABASE_URL isn't set"
+)
+
+
+@pytest.fixture(scope="module")
+def navigator_engine():
+    engine = create_engine(DATABASE_URL)
+    # only the navigator tables, not the documents database's
+    documents_tables = {
+        Document.__table__,
+        Label.__table__,
+        DocumentLabelLink.__table__,
+    }
+    tables = [
+        table
+        for table in SQLModel.metadata.sorted_tables
+        if table not in documents_tables
+    ]
+    SQLModel.metadata.drop_all(engine, tables=tables)
+    SQLModel.metadata.create_all(engine, tables=tables)
+    with Session(engine) as session:
+        session.add(Organisation(id=1, name="Organisation"))
+        for batch in generate_documents(DOCUMENTS, batch_size=DOCUMENTS):
+            session.add_all(batch)
+        session.commit()
+
+    yield engine
+    engine.dispose()
+
+
+@pytest.fixture
+def statements(navigator_engine, monkeypatch):
+    """The SQL the export runs against `navigator_engine`."""
+    monkeypatch.setattr(main, "navigator_engine", navigator_engine)
+    statements: list[str] = []
+
+    def before_cursor_execute(conn, cursor, statement, parameters, context, many):
+        statements.append(statement)
+
+    event.listen(navigator_engine, "before_cursor_execute", before_cursor_execute)
+    yield statements
+    event.remove(navigator_engine, "before_cursor_execute", before_cursor_execute)
+
+
+def test_export_batch_runs_a_fixed_number_of_queries(statements, tmp_path):
+    rows = main.export_documents(
+        str(tmp_path / "documents.jsonl"), batch_size=DOCUMENTS * 2
+    )
+
+    assert rows == DOCUMENTS
+    # the documents with their family graph joined, then the geographies select-in
+    assert len(statements) == 2
+
+
+def test_export_queries_grow_with_batches_not_documents(statements, tmp_path):
+    rows = main.export_documents(str(tmp_path / "documents.jsonl"), batch_size=100)
+
+    assert rows == DOCUMENTS
+    # two per batch, and the empty batch that ends the export
+    assert len(statements) == 5 * 2 + 1
+
+
+def test_pushdown_export_runs_one_query_per_batch(statements, tmp_path):
+    rows = main.export_documents(
+        str(tmp_path / "documents.jsonl"), batch_size=DOCUMENTS * 2, pushdown=True
+    )
+
+    assert rows == DOCUMENTS
+    assert len(statements) == 1
+
+
+def test_incremental_export_includes_new_documents(
+    navigator_engine, monkeypatch, tmp_path
+):
+    monkeypatch.setattr(main, "navigator_engine", navigator_engine)
+    feed_file = tmp_path / "documents.delta.jsonl"
+    # nothing has changed since, so only the new documents are exported
+    rows = main.export_documents(
+        str(feed_file),
+        batch_size=DOCUMENTS,
+        since=datetime(2100, 1, 1),
+        new_ids={1, 2},
+    )
+
+    assert rows == 2
+    with open(feed_file, encoding="utf-8") as f:
+        assert [json.loads(line)["put"] for line in f] == [
+            main.vespa_id(1),
+            main.vespa_id(2),
+        ]
+
+
+def test_orm_and_pushdown_exports_write_the_same_feed(
+    navigator_engine, monkeypatch, tmp_path
+):
+    monkeypatch.setattr(main, "navigator_engine", navigator_engine)
+    timestamp = datetime(2024, 1, 1)
+    for pushdown in (False, True):
+        main.export_documents(
+            str(tmp_path / f"documents.{pushdown}.jsonl"),
+            batch_size=100,
+            timestamp=timestamp,
+            pushdown=pushdown,
+        )
+
+    orm_feed = (tmp_path / "documents.False.jsonl").read_text(encoding="utf-8")
+    pushdown_feed = (tmp_path / "documents.True.jsonl").read_text(encoding="utf-8")
+    assert orm_feed == pushdown_feed
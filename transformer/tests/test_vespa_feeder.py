@@ -0,0 +1,44 @@
+import asyncio
+import json
+from functools import partial
+
+import httpx
+import pytest
+
+import vespa_feeder
+import vespa_stub
+
+
+@pytest.fixture
+def stub(monkeypatch):
+    """Points the feeder's client at vespa_stub.py, in process."""
+    monkeypatch.setattr(
+        vespa_feeder.httpx,
+        "AsyncClient",
+        partial(httpx.AsyncClient, transport=httpx.ASGITransport(app=vespa_stub.app)),
+    )
+    vespa_stub.documents.clear()
+    yield vespa_stub.documents
+    vespa_stub.documents.clear()
+
+
+@pytest.mark.parametrize("concurrency", [1, 4])
+def test_feed_skips_an_unknown_operation(stub, tmp_path, concurrency):
+    feed_file = tmp_path / "documents.jsonl"
+    operations = [
+        {"put": f"id:production:documents::{i}", "fields": {"title": str(i)}}
+        for i in range(10)
+    ]
+    operations.insert(5, {"upsert": "id:production:documents::bad", "fields": {}})
+    feed_file.write_text("\n".join(json.dumps(operation) for operation in operations))
+
+    # a worker that died would leave the feed waiting on the queue forever
+    stats = asyncio.run(
+        asyncio.wait_for(
+            vespa_feeder.feed(str(feed_file), "http://vespa", concurrency=concurrency),
+            timeout=10,
+        )
+    )
+
+    assert (stats.ok, stats.failed) == (10, 1)
+    assert len(stub) == 10